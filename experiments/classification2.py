@@ -18,47 +18,6 @@ def ratio_predicate(aspect1, aspect2):
 def filter_predicate(olds, oldSelector, curr, currSelector, predicate):
 	return [old for old in olds if predicate(oldSelector(old), currSelector(curr))]
 
-# unused
-def find_best_heldout(ratio, grid, pca, text, page, line, glyph, k):
-	olds = list(classify_collection.find({}))
-	olds = list(filter(lambda o : o['text'] != text or o['page'] != page or 
-				o['line'] != line or o['glyph'] != glyph, olds))
-	return find_best_ranked(ratio, grid, pca, olds, k)
-
-# unused
-def find_best_in(ratio, grid, pca, olds):
-	current = { 'ratio': ratio, 'grid': grid, 'pca': pca }
-	if False:
-		olds_less = filter_predicate(olds, lambda o : o['ratio'], current, lambda c : c['ratio'], ratio_predicate)
-		if len(olds_less) > 0:
-			olds = olds_less
-	olds = filter_distance(olds, lambda o : o['pca'], current, lambda c : c['pca'], squared_distance, 1)
-	if False:
-		olds = filter_distance(olds, lambda o : o['grid'], current, lambda c : c['grid'], distort_distance, 1)
-	return olds[0]['sign']
-
-# unused
-def find_best_ranked(ratio, grid, pca, olds, k):
-	current = { 'ratio': ratio, 'grid': grid, 'pca': pca }
-	olds = filter_distance(olds, lambda o : o['pca'], current, 
-			lambda c : c['pca'], squared_distance, len(olds))
-	return best_signs(olds, k)
-
-# unused
-def find_best_k(ratio, grid, pca, k):
-	current = { 'ratio': ratio, 'grid': grid, 'pca': pca }
-	olds = list(classify_collection.find({}))
-	olds = filter_distance(olds, lambda o : o['pca'], current, lambda c : c['pca'], squared_distance, len(olds))
-	return best_signs(olds, k)
-
-# unused
-def find_best_k_distribution(ratio, grid, pca, k):
-	current = { 'ratio': ratio, 'grid': grid, 'pca': pca }
-	olds = list(classify_collection.find({}))
-	olds = filter_distance(olds, lambda o : o['pca'], current, lambda c : c['pca'], squared_distance, len(olds))
-	best = best_candidates(olds, k)
-	return make_pca_distribution(pca, best)
-
 def best_signs(candidates, k):
 	best_signs = []
 	best_candidates = []
@@ -24,10 +24,11 @@ import torchvision.transforms as transforms
 import includemain
 from graphics2 import add_background, image_to_skeleton, image_to_center, image_to_square
 from reduction2 import get_reduction2, VGG, AlexNet, Sobel, FFT
-from classification2 import filter_distance, best_signs, squared_distance
-from imagedistortion import distortion_distance
+from classification2 import best_signs
+from imagedistortion import pad_grids, distortion_distances
 from indexing import Indexing
 from idm import IDM
+from featurestore import FeatureStore
 from cnn import CnnDataset, train_glyphnet, train_bgk, train_cnn1, train_cnn2, train_cnn3
 
 ## Constants
@@ -117,7 +118,7 @@ def show_glyph(token):
 	im = ImageTk.PhotoImage(image)
 	label.configure(image=im)
 	label.image = im
-	image.save(RESULTS_DIR + '/original' + str(n_tests_done) + '.png')
+	image.save(config.results_dir + '/original' + str(n_tests_done) + '.png')
 	canvas.delete('all')
 
 thickness_draw = 10
@@ -164,21 +165,8 @@ def release_erase(event):
 # Further: 'GlyphNet'. Has highest accuracy overall.
 # Further: 'BGK'. Has lower accuracy.
 # Further: 'CNN1', 'CNN2', 'CNN3'. Not as good as GlyphNet.
-method = None
-grid_size = None
-dimension = None
-skeleton = None
-n_vals = None
-n_tests = None
-n_best = None
-filter_ligatures = None
-filter_sign = None
-filter_common = None
-binarize = None
-center = None
-rerank_grid_size = None
-warp = None
-context = None
+# The arguments of the run, as in default_args below.
+config = None
 
 hits = None
 classifications = None
@@ -187,31 +175,45 @@ precision_hits = None
 recall_counts = None
 recall_hits = None
 time_total = None
+time_train = None
+time_test = None
 reductions = None
 handdrawn_index = None
+features = None
 
 def normalize_image(im):
-	if binarize:
+	if config.binarize:
 		return im.convert('1', dither=None)
 	else:
 		return im.convert('L')
 
+def results():
+	n = len(test_tokens)
+	prec = mean([precision_hits[c] / precision_counts[c] for c in precision_counts])
+	rec = mean([recall_hits[c] / recall_counts[c] for c in recall_counts])
+	return {
+		'accuracy': hits[0] / n,
+		'top': [hit / n for hit in hits],
+		'precision': prec,
+		'recall': rec,
+		'f': 2 * prec * rec / (prec + rec),
+		'train_time': time_train,
+		'token_time': time_test / n}
+
 def report():
-	print('Method', method)
-	for i in range(n_best):
+	print('Method', config.method)
+	for i in range(config.n_best):
 		print('correct top {}: {} out of {}, which is {:0.1f} %'.format(\
 				i+1, hits[i], len(test_tokens), 100 * hits[i] / len(test_tokens)))
-	prec = mean([precision_hits[c] / precision_counts[c] for c in precision_counts])
-	rec = mean([recall_hits[c] / recall_counts[c] for c in recall_counts])
-	f = 2 * prec * rec / (prec + rec)
+	scores = results()
 	print('precision: {:0.1f} %; recall: {:0.1f} %; F: {:0.1f} %'.format(\
-				prec * 100, rec * 100, f * 100))
-	dump_json(classifications, RESULTS_DIR, 'classifications.json')
+				scores['precision'] * 100, scores['recall'] * 100, scores['f'] * 100))
+	dump_json(classifications, config.results_dir, 'classifications.json')
 
 def evaluate(cl, classes):
-	for i in range(n_best):
+	for i in range(config.n_best):
 		if len(classes) >= i+1 and classes[i] == cl:
-			for j in range(i, n_best):
+			for j in range(i, config.n_best):
 				hits[j] += 1
 	if len(classes) > 0:
 		# debug_str(map_unicode_to_names(cl), 56)
@@ -225,18 +227,18 @@ def evaluate(cl, classes):
 
 def image_to_block(image, size):
 	# debug_image(image, 56)
-	if skeleton is not None:
-		im = image_to_skeleton(image, skeleton)
+	if config.skeleton is not None:
+		im = image_to_skeleton(image, config.skeleton)
 		if False and n_tests_done is not None:
-			file_original = RESULTS_DIR + '/original' + str(n_tests_done) + '.png'
+			file_original = config.results_dir + '/original' + str(n_tests_done) + '.png'
 			image.save(file_original)
-			file_derived = RESULTS_DIR + '/derived' + str(n_tests_done) + '.png'
+			file_derived = config.results_dir + '/derived' + str(n_tests_done) + '.png'
 			plt.imsave(file_derived, im, cmap='Greys_r')
 			# derived = Image.fromarray(np.uint8(im)).convert('RGB')
-			# derived.save(RESULTS_DIR + '/derived' + str(n_tests_done-1) + '.png')
+			# derived.save(config.results_dir + '/derived' + str(n_tests_done-1) + '.png')
 	else:
 		im = add_background(image)
-	if center:
+	if config.center:
 		im = image_to_center(im, size, False)
 	else:
 		im = image_to_square(im, size)
@@ -249,12 +251,31 @@ def image_to_grid(image, size):
 	return np.asarray(im)
 
 def image_to_vector(image):
-	return image_to_grid(image, grid_size).flatten()
+	return image_to_grid(image, config.grid_size).flatten()
 
-def image_to_torch(image):
-	im = image_to_block(image, grid_size).convert('L')
-	transform = transforms.ToTensor()
-	return transform(im)
+# Grids and blocks of the tokens of the dataset, from the feature store.
+# Blocks are kept in grey levels, so they do not depend on binarize.
+
+def token_to_grid(token, size):
+	return features.get(token['file'], 'grid', (size, config.skeleton, config.center, config.binarize),
+		lambda file: image_to_grid(Image.open(file), size))
+
+def token_to_block(token, size):
+	return features.get(token['file'], 'block', (size, config.skeleton, config.center),
+		lambda file: image_to_block(Image.open(file), size).convert('L'))
+
+# Stores the features of one kind and size of the files, with the skeleton,
+# center and binarize of the arguments.
+def store_features(args, files, kind, size):
+	global features
+	set_args(args)
+	features = FeatureStore()
+	for file in files:
+		if kind == 'grid':
+			token_to_grid({'file': file}, size)
+		else:
+			token_to_block({'file': file}, size)
+	features.save()
 
 ## Training and testing
 	
@@ -284,40 +305,37 @@ def add_test_features(token):
 	add_vector(token)
 	add_scaled(token)
 	# debug_str(token['scaled'], 56)
-	if method == 'LDA':
+	if config.method == 'LDA':
 		add_lda(token)
-	elif method == 'VGG' or method == 'VGGwithouttop':
+	elif config.method == 'VGG' or config.method == 'VGGwithouttop':
 		add_vgg(token)
-	elif method == 'AlexNet':
+	elif config.method == 'AlexNet':
 		add_alexnet(token)
-	elif method == 'Sobel':
+	elif config.method == 'Sobel':
 		add_sobel(token)
-	elif method == 'FFT':
+	elif config.method == 'FFT':
 		add_fft(token)
-	elif method == 'IDM':
+	elif config.method == 'IDM':
 		add_idm(token)
-	elif method in ['GlyphNet', 'BGK', 'CNN1', 'CNN2', 'CNN3']:
+	elif config.method in ['GlyphNet', 'BGK', 'CNN1', 'CNN2', 'CNN3']:
 		add_torch(token)
 	else:
-		add_method(token, method)
+		add_method(token, config.method)
 
 def make_token_and_features(im, sign):
 	token = {'sign': sign, 'vector': image_to_vector(im)}
 	add_scaled(token)
-	if method == 'LDA':
+	if config.method == 'LDA':
 		add_lda(token)
-	if method == 'IDM':
+	if config.method == 'IDM':
 		add_idm(token)
 	else:
-		add_method(token, method)
+		add_method(token, config.method)
 	return token
 
-def distort_distance(im1, im2):
-	return distortion_distance(im1, im2, rerank_grid_size, warp=warp, context=context, bilevel=binarize)
-
 def classify(test_token):
-	candidates = reductions['Index'].query(test_token[method], k=len(train_tokens) // 10)
-	return best_signs(candidates, n_best)
+	candidates = reductions['Index'].query(test_token[config.method], k=len(train_tokens) // 10)
+	return best_signs(candidates, config.n_best)
 
 # TMP
 if False:
@@ -335,10 +353,10 @@ if False:
 
 def classify_and_evaluate(test_token, time_token):
 	global tmp_count, tmp_unknown, tmp_wrong
-	if method == 'LDA':
-		evaluate(test_token['sign'], test_token[method])
-	elif method in ['GlyphNet', 'BGK', 'CNN1', 'CNN2', 'CNN3']:
-		signs = reductions[method].query(test_token['torch'])[:n_best]
+	if config.method == 'LDA':
+		evaluate(test_token['sign'], test_token[config.method])
+	elif config.method in ['GlyphNet', 'BGK', 'CNN1', 'CNN2', 'CNN3']:
+		signs = reductions[config.method].query(test_token['torch'])[:config.n_best]
 		evaluate(test_token['sign'], signs)
 	else:
 		signs, candidates = classify(test_token)
@@ -350,14 +368,14 @@ def classify_and_evaluate(test_token, time_token):
 				labels = [map_unicode_to_names(t['sign']) for t in candidates]
 				test_image = token_to_image(test_token)
 				test_name = str(tmp_count) + '-te-' + test_sign + '.png'
-				test_image.save(RESULTS_DIR + '/' + test_name)
+				test_image.save(config.results_dir + '/' + test_name)
 				print("SYNC", tmp_wrong+1, tmp_count)
 				try:
 					wrong_index = labels.index(wrong_sign)
 					wrong_token = candidates[wrong_index]
 					wrong_image = token_to_image(wrong_token)
 					wrong_name = str(tmp_count) + '-tr-' + wrong_sign + '.png'
-					wrong_image.save(RESULTS_DIR + '/' + wrong_name)
+					wrong_image.save(config.results_dir + '/' + wrong_name)
 				except ValueError:
 					print("WRONG type", tmp_wrong+1, wrong_sign)
 				try:
@@ -365,7 +383,7 @@ def classify_and_evaluate(test_token, time_token):
 					other_token = candidates[other_index]
 					other_image = token_to_image(other_token)
 					other_name = str(tmp_count) + '-tz-' + test_sign + '.png'
-					other_image.save(RESULTS_DIR + '/' + other_name)
+					other_image.save(config.results_dir + '/' + other_name)
 				except ValueError:
 					None
 			else:
@@ -373,20 +391,21 @@ def classify_and_evaluate(test_token, time_token):
 			tmp_wrong += 1
 		# tmp_count += 1
 		# TMP stop test
-		if rerank_grid_size is not None:
+		if config.rerank_grid_size is not None:
 			add_rerank_grid(test_token)
 			for c in candidates:
 				add_rerank_grid(c)
-			selector = lambda o : o['grid']
-			reranked = filter_distance(candidates, selector,
-				test_token, selector, distort_distance, len(candidates))
-			signs = [r['sign'] for r in reranked]
+			padded = pad_grids([c['grid'] for c in candidates], config.context, config.binarize)
+			distances = distortion_distances(padded, test_token['grid'], config.rerank_grid_size,
+				warp=config.warp, context=config.context, bilevel=config.binarize)
+			reranked = np.argsort(distances, kind='stable')
+			signs = [candidates[i]['sign'] for i in reranked]
 		evaluate(test_token['sign'], signs)
 	if time_token:
 		classifications[-1]['time'] = round(time_token, 3)
 
 def test_plain():
-	global n_tests_done
+	global n_tests_done, time_test
 	n_tests_done = 0
 	start = time.time()
 	for token in test_tokens:
@@ -394,6 +413,8 @@ def test_plain():
 		classify_and_evaluate(token, None)
 		n_tests_done += 1
 	end = time.time()
+	features.save()
+	time_test = end-start
 	print('Classification took {0:0.1f} sec'.format(end-start))
 	# TMP
 	# print(tmp_unknown, tmp_wrong)
@@ -411,7 +432,7 @@ def classify_manual():
 	bbox = inverted.getbbox()
 	im = im.crop(bbox)
 	file_derived = 'derived' + str(n_tests_done-1) + '.png'
-	im.save(RESULTS_DIR + '/' + file_derived)
+	im.save(config.results_dir + '/' + file_derived)
 	token = make_token_and_features(im, test_token['sign'])
 	handdrawn_index.append({'sign': token['sign'], 'file': file_derived})
 	classify_and_evaluate(token, time_token)
@@ -425,18 +446,16 @@ def test_manual():
 		n_tests_done += 1
 		start = None
 	else:
-		print('Seconds per token:', time_total / n_tests)
+		print('Seconds per token:', time_total / config.n_tests)
 		window.destroy()
 		
 ## Training
 
 def add_rerank_grid(token):
-	image = token_to_image(token)
-	token['grid'] = image_to_grid(image, rerank_grid_size)
+	token['grid'] = token_to_grid(token, config.rerank_grid_size)
 
 def add_vector(token):
-	image = token_to_image(token)
-	token['vector'] = image_to_vector(image)
+	token['vector'] = token_to_grid(token, config.grid_size).flatten()
 
 def add_vectors():
 	for token in train_tokens:
@@ -455,8 +474,8 @@ def add_scaleds():
 		add_scaled(token)
 
 def add_torch(token):
-	image = token_to_image(token)
-	token['torch'] = image_to_torch(image)
+	transform = transforms.ToTensor()
+	token['torch'] = transform(token_to_block(token, config.grid_size))
 
 def add_torchs():
 	for token in train_tokens:
@@ -469,8 +488,8 @@ def add_method(token, method):
 
 def add_dim_red():
 	global reductions
-	reduction = get_reduction2(method, dimension)
-	reductions[method] = reduction
+	reduction = get_reduction2(config.method, config.dimension)
+	reductions[config.method] = reduction
 	reductions['Index'] = Indexing()
 	start = time.time()
 	embeddings = reduction.fit_transform([token['scaled'] for token in train_tokens])
@@ -478,8 +497,8 @@ def add_dim_red():
 	print('Training took {0:0.1f} sec'.format(end-start))
 	for i in range(len(train_tokens)):
 		token = train_tokens[i]
-		token[method] = embeddings[i].tolist()
-		reductions['Index'].add(token[method], token)
+		token[config.method] = embeddings[i].tolist()
+		reductions['Index'].add(token[config.method], token)
 	reductions['Index'].finalize()
 
 def make_class_index():
@@ -494,7 +513,7 @@ def make_class_index():
 
 def add_lda(token):
 	scores = reductions['LDA'].predict_log_proba([token['scaled']])[0]
-	indexes = nlargest(n_best, range(scores.size), key=lambda i: scores[i])
+	indexes = nlargest(config.n_best, range(scores.size), key=lambda i: scores[i])
 	token['LDA'] = [classes[index] for index in indexes]
 
 def add_ldas():
@@ -505,20 +524,20 @@ def add_ldas():
 	reduction.fit([token['scaled'] for token in train_tokens], class_indexes)
 	end = time.time()
 	print('Training took {0:0.1f} sec'.format(end-start))
-	reductions[method] = reduction
+	reductions[config.method] = reduction
 
 def add_vgg(token):
-	token[method] = reductions['VGG'].transform(token['file'])
+	token[config.method] = reductions['VGG'].transform(token['file'])
 
 def add_vggs():
 	global reductions
-	withouttop = (method == 'VGGwithouttop')
+	withouttop = (config.method == 'VGGwithouttop')
 	start = time.time()
 	reductions['VGG'] = VGG(withouttop=withouttop)
 	reductions['Index'] = Indexing()
 	for token in train_tokens:
 		add_vgg(token)
-		reductions['Index'].add(token[method], token)
+		reductions['Index'].add(token[config.method], token)
 	end = time.time()
 	print('Training took {0:0.1f} sec'.format(end-start))
 	reductions['Index'].finalize()
@@ -540,7 +559,7 @@ def add_sobel(token):
 
 def add_sobels():
 	global reductions
-	reductions['Sobel'] = Sobel(grid_size)
+	reductions['Sobel'] = Sobel(config.grid_size)
 	reductions['Index'] = Indexing()
 	for token in train_tokens:
 		add_sobel(token)
@@ -552,7 +571,7 @@ def add_fft(token):
 
 def add_ffts():
 	global reductions
-	reductions['FFT'] = FFT(grid_size)
+	reductions['FFT'] = FFT(config.grid_size)
 	reductions['Index'] = Indexing()
 	for token in train_tokens:
 		add_fft(token)
@@ -560,12 +579,11 @@ def add_ffts():
 	reductions['Index'].finalize()
 
 def add_idm(token):
-	image = token_to_image(token)
-	token['IDM'] = image_to_grid(image, grid_size)
+	token['IDM'] = token_to_grid(token, config.grid_size)
 
 def add_idms():
 	global reductions
-	reductions['Index'] = IDM(grid_size, warp, context, binarize)
+	reductions['Index'] = IDM(config.grid_size, config.warp, config.context, config.binarize)
 	for token in train_tokens:
 		add_idm(token)
 		reductions['Index'].add(token['IDM'], token)
@@ -575,20 +593,20 @@ def add_cnn():
 	train_set = CnnDataset(train_tokens, class_to_int, classes)
 	val_tokens_known = [token for token in val_tokens if token['sign'] in class_to_int]
 	val_set = CnnDataset(val_tokens_known, class_to_int, classes)
-	ensure_exists(MODEL_DIR)
+	ensure_exists(config.model_dir)
 	start = time.time()
-	if method == 'GlyphNet':
-		reductions[method] = train_glyphnet(train_set, val_set, grid_size, MODEL_DIR + '/cnnmodel.pth')
-	elif method == 'BGK':
-		reductions[method] = train_bgk(train_set, val_set, grid_size, MODEL_DIR + '/cnnmodel.pth')
-	elif method == 'CNN1':
-		reductions[method] = train_cnn1(train_set, val_set, grid_size, MODEL_DIR + '/cnnmodel.pth')
-	elif method == 'CNN2':
-		reductions[method] = train_cnn2(train_set, val_set, grid_size, MODEL_DIR + '/cnnmodel.pth')
-	elif method == 'CNN3':
-		reductions[method] = train_cnn3(train_set, val_set, grid_size, MODEL_DIR + '/cnnmodel.pth')
+	if config.method == 'GlyphNet':
+		reductions[config.method] = train_glyphnet(train_set, val_set, config.grid_size, config.model_dir + '/cnnmodel.pth')
+	elif config.method == 'BGK':
+		reductions[config.method] = train_bgk(train_set, val_set, config.grid_size, config.model_dir + '/cnnmodel.pth')
+	elif config.method == 'CNN1':
+		reductions[config.method] = train_cnn1(train_set, val_set, config.grid_size, config.model_dir + '/cnnmodel.pth')
+	elif config.method == 'CNN2':
+		reductions[config.method] = train_cnn2(train_set, val_set, config.grid_size, config.model_dir + '/cnnmodel.pth')
+	elif config.method == 'CNN3':
+		reductions[config.method] = train_cnn3(train_set, val_set, config.grid_size, config.model_dir + '/cnnmodel.pth')
 	else:
-		print('Unknown CNN method:', method)
+		print('Unknown CNN method:', config.method)
 	end = time.time()
 	print('Training took {0:0.1f} sec'.format(end-start))
 
@@ -596,20 +614,20 @@ def train():
 	add_vectors()
 	add_scaleds()
 	make_class_index()
-	print('Training', method)
-	if method == 'LDA':
+	print('Training', config.method)
+	if config.method == 'LDA':
 		add_ldas()
-	elif method == 'VGG' or method == 'VGGwithouttop':
+	elif config.method == 'VGG' or config.method == 'VGGwithouttop':
 		add_vggs()
-	elif method == 'AlexNet':
+	elif config.method == 'AlexNet':
 		add_alexnets()
-	elif method == 'Sobel':
+	elif config.method == 'Sobel':
 		add_sobels()
-	elif method == 'FFT':
+	elif config.method == 'FFT':
 		add_ffts()
-	elif method == 'IDM':
+	elif config.method == 'IDM':
 		add_idms()
-	elif method in ['GlyphNet', 'BGK', 'CNN1', 'CNN2', 'CNN3']:
+	elif config.method in ['GlyphNet', 'BGK', 'CNN1', 'CNN2', 'CNN3']:
 		add_torchs()
 		add_cnn()
 	else:
@@ -624,9 +642,9 @@ def read_tokens(args):
 	tokens = load_json(args.input_dir, 'index.json')
 	for token in tokens:
 		token['file'] = os.path.join(args.input_dir, token['file'])
-	if filter_sign is not None:
-		tokens = [token for token in tokens if map_unicode_to_names(token['sign']) == filter_sign]
-	elif filter_ligatures:
+	if config.filter_sign is not None:
+		tokens = [token for token in tokens if map_unicode_to_names(token['sign']) == config.filter_sign]
+	elif config.filter_ligatures:
 		tokens = [token for token in tokens if len(token['sign']) == 1]
 	if args.truncate_start is not None:
 		tokens = tokens[-args.truncate_start:]
@@ -638,11 +656,11 @@ def read_tokens(args):
 	return tokens
 
 def prepare_data(args):
-	global train_tokens, train_signs, val_tokens, test_tokens
+	global train_tokens, train_signs, val_tokens, test_tokens, time_train
 	tokens = read_tokens(args)
-	train_tokens = tokens[:-(n_vals+n_tests)]
-	val_tokens = tokens[-(n_vals+n_tests):-n_tests]
-	test_tokens = tokens[-n_tests:]
+	train_tokens = tokens[:-(config.n_vals+config.n_tests)]
+	val_tokens = tokens[-(config.n_vals+config.n_tests):-config.n_tests]
+	test_tokens = tokens[-config.n_tests:]
 	if args.filter_common is not None:
 		counter = Counter([token['sign'] for token in train_tokens])
 		frequent_items = sorted(counter.items(), key=lambda item: -item[1])[:args.filter_common]
@@ -653,16 +671,18 @@ def prepare_data(args):
 	train_signs = {token['sign'] for token in train_tokens}
 	print('Training size: {}; validation size: {}; test size: {}'.format(\
 			len(train_tokens), len(val_tokens), len(test_tokens)))
+	start = time.time()
 	train()
+	time_train = time.time() - start
 
 def make_train_statistics():
 	trainfreq = Counter([map_unicode_to_names(token['sign']) for token in train_tokens])
-	dump_json(trainfreq, RESULTS_DIR, 'trainfreq.json')
+	dump_json(trainfreq, config.results_dir, 'trainfreq.json')
 
 def count(args):
 	set_args(args)
 	tokens = load_json(args.input_dir, 'index.json')
-	if filter_ligatures:
+	if config.filter_ligatures:
 		tokens = [token for token in tokens if len(token['sign']) == 1]
 	n_tokens = len(tokens)
 	types_list = [token['sign'] for token in tokens]
@@ -699,10 +719,10 @@ def count(args):
 def prepare(args):
 	global hits, classifications, \
 		precision_counts, precision_hits, recall_counts, recall_hits, \
-		time_total, reductions, handdrawn_index
+		time_total, reductions, handdrawn_index, features
 	set_args(args)
-	ensure_exists_empty(RESULTS_DIR)
-	hits = [0 for i in range(n_best)]
+	ensure_exists_empty(config.results_dir)
+	hits = [0 for i in range(config.n_best)]
 	classifications = []
 	precision_counts = defaultdict(int)
 	precision_hits = defaultdict(int)
@@ -711,7 +731,9 @@ def prepare(args):
 	time_total = 0
 	reductions = {}
 	handdrawn_index = []
+	features = FeatureStore()
 	prepare_data(args)
+	features.save()
 	make_train_statistics()
 
 def read_handdrawn(args):
@@ -740,27 +762,35 @@ def run_manual(args):
 	test_manual()
 	window.mainloop()
 	report()
-	dump_json(handdrawn_index, RESULTS_DIR, 'index.json')
+	dump_json(handdrawn_index, config.results_dir, 'index.json')
 
 def set_args(args):
-	global method, grid_size, dimension, skeleton, \
-			n_vals, n_tests, n_best, filter_ligatures, filter_sign, filter_common, \
-			binarize, center, rerank_grid_size, warp, context
-	method = args.method
-	grid_size = args.grid_size
-	dimension = args.dimension
-	skeleton = args.skeleton
-	n_vals = args.n_vals
-	n_tests = args.n_tests
-	n_best = args.n_best
-	filter_ligatures = args.filter_ligatures
-	filter_sign = args.filter_sign
-	filter_common = args.filter_common
-	binarize = args.binarize
-	center = args.center
-	rerank_grid_size = args.rerank_grid_size
-	warp = args.warp
-	context = args.context
+	global config
+	config = args
+
+def default_args():
+	return Namespace(
+		method='PCA',
+		input_dir=DATA_DIR,
+		handdrawn_dir=HANDDRAWN_DIR,
+		truncate_start=8400, # Added to compare experiments
+		truncate_end=None, # Added to compare experiments
+		grid_size=40,
+		dimension=50,
+		skeleton=None,
+		n_vals=700,
+		n_tests=1000,
+		n_best=5,
+		filter_ligatures=True,
+		filter_sign=None,
+		filter_common=None,
+		binarize=False,
+		center=False,
+		rerank_grid_size=None,
+		warp=1,
+		context=1,
+		results_dir=RESULTS_DIR,
+		model_dir=MODEL_DIR)
 
 arguments = [
 	('m', 'method'),
@@ -782,6 +812,19 @@ arguments = [
 	('r', 'rerank_grid_size'),
 	('w', 'warp'),
 	('x', 'context')]
+
+def parse_value(val):
+	if val == 'True':
+		return True
+	elif val == 'False':
+		return False
+	elif val == 'None':
+		return None
+	elif val.isnumeric():
+		return int(val)
+	else:
+		return val
+
 short_args = ''.join([short + ':' for (short, _) in arguments])
 long_args = [long + '=' for (_, long) in arguments]
 
@@ -790,26 +833,7 @@ if __name__ == '__main__':
 		print('First argument is a number identifying an experiment')
 		exit(0)
 	exp_name = sys.argv[1]
-	args = Namespace(
-		method='PCA',
-		input_dir=DATA_DIR,
-		handdrawn_dir=HANDDRAWN_DIR,
-		truncate_start=8400, # Added to compare experiments
-		truncate_end=None, # Added to compare experiments
-		grid_size=40,
-		dimension=50,
-		skeleton=None,
-		n_vals=700,
-		n_tests=1000,
-		n_best=5,
-		filter_ligatures=True,
-		filter_sign=None,
-		filter_common=None,
-		binarize=False,
-		center=False,
-		rerank_grid_size=None,
-		warp=1,
-		context=1)
+	args = default_args()
 	print(' '.join(sys.argv[1:]))
 	try:
 		opts, vals = getopt(sys.argv[2:], short_args, long_args)
@@ -819,14 +843,7 @@ if __name__ == '__main__':
 	for opt, val in opts:
 		for (short, long) in arguments:
 			if opt == '-' + short or opt == '--' + long:
-				if val == 'True':
-					vars(args)[long] = True
-				elif val == 'False':
-					vars(args)[long] = False
-				elif val.isnumeric():
-					vars(args)[long] = int(val)
-				else:
-					vars(args)[long] = val
+				vars(args)[long] = parse_value(val)
 				break
 	match exp_name:
 		case 'freeze':
@@ -0,0 +1,62 @@
+import os
+import glob
+import hashlib
+import numpy as np
+
+# Features of glyph images, addressed by the SHA-1 of the image file and the
+# parameters they were derived with, so that runs over the same frozen data
+# decode and resize each image only once. Features of one kind and one set of
+# parameters have a directory of their own, holding .npy shards of records
+# (key, value); new features are written as a further shard on save, under a
+# name of their own, so that concurrent processes do not overwrite each other.
+
+STORE_DIR = 'features'
+
+class FeatureStore:
+	def __init__(self, directory=STORE_DIR):
+		self.directory = directory
+		self.digests = {}
+		self.loaded = {}
+		self.pending = {}
+
+	def digest(self, file):
+		if file not in self.digests:
+			with open(file, 'rb') as handle:
+				self.digests[file] = hashlib.sha1(handle.read()).hexdigest()
+		return self.digests[file]
+
+	def name(self, kind, params):
+		return '-'.join([kind] + [str(param) for param in params])
+
+	def features(self, name):
+		if name not in self.loaded:
+			features = {}
+			for shard in sorted(glob.glob(os.path.join(self.directory, name, '*.npy'))):
+				records = np.load(shard)
+				features.update(zip(records['key'].tolist(), records['value']))
+			self.loaded[name] = features
+		return self.loaded[name]
+
+	# Gets the features of the file, computing them with compute(file) when
+	# not stored yet.
+	def get(self, file, kind, params, compute):
+		name = self.name(kind, params)
+		features = self.features(name)
+		key = self.digest(file).encode('ascii')
+		if key not in features:
+			features[key] = np.asarray(compute(file))
+			self.pending.setdefault(name, []).append(key)
+		return features[key]
+
+	def save(self):
+		for name, keys in self.pending.items():
+			values = [self.loaded[name][key] for key in keys]
+			records = np.empty(len(keys), dtype=[('key', 'S40'), ('value', values[0].dtype, values[0].shape)])
+			records['key'] = keys
+			records['value'] = values
+			directory = os.path.join(self.directory, name)
+			os.makedirs(directory, exist_ok=True)
+			shard = os.path.join(directory, '{}-{}'.format(os.getpid(), len(os.listdir(directory))))
+			np.save(shard + '.tmp.npy', records)
+			os.replace(shard + '.tmp.npy', shard + '.npy')
+		self.pending = {}
@@ -1,7 +1,24 @@
-from heapq import nsmallest
+import sys
+import os
+import json
+import time
+import numpy as np
 
-from classification2 import filter_distance
-from imagedistortion import distortion_distance
+import includemain
+from distortion import pad_grids, distortion_distances, shifted_queries, row_costs, \
+	warp_envelope, row_lower_bounds
+
+# Exact k nearest neighbours by image distortion distance. References are
+# visited in order of a lower bound of their distance, from the envelope of
+# the query over the warp, and the search stops when the bound exceeds the
+# k-th best distance. Distances are computed a few pixel rows at a time, and
+# a reference is abandoned once its partial sum plus the bound of its
+# remaining rows exceeds the k-th best. Ties are broken by order of addition,
+# as in the exhaustive search.
+
+first_block_size = 16
+max_block_size = 256
+rows_per_step = 4
 
 class IDM:
 	def __init__(self, grid_size, warp, context, bilevel):
@@ -11,13 +28,84 @@ class IDM:
 		self.bilevel = bilevel
 		self.grids = []
 		self.tokens = []
+		self.padded = None
 
 	def add(self, grid, token):
 		self.grids.append(grid)
 		self.tokens.append(token)
+		self.padded = None
 
-	def query(self, grid, k=1):
-		distances = [distortion_distance(old_grid, grid, self.grid_size, warp=self.warp, context=self.context, bilevel=self.bilevel) \
-						for old_grid in self.grids]
-		candidates = nsmallest(k, range(len(self.grids)), key=lambda i : distances[i])
+	def padded_grids(self):
+		if self.padded is None:
+			self.padded = pad_grids(self.grids, self.context, self.bilevel)
+		return self.padded
+
+	def query_exhaustive(self, grid, k=1):
+		distances = distortion_distances(self.padded_grids(), grid, self.grid_size, \
+						warp=self.warp, context=self.context, bilevel=self.bilevel)
+		candidates = np.argsort(distances, kind='stable')[:k]
 		return [self.tokens[i] for i in candidates]
+
+	def query(self, grid, k=1):
+		padded = self.padded_grids()
+		size = self.grid_size
+		shifts = shifted_queries(grid, size, self.warp, self.context, self.bilevel)
+		lower, upper = warp_envelope(grid, size, self.warp, self.context, self.bilevel)
+		bounds = row_lower_bounds(padded, lower, upper, size, self.context, self.bilevel)
+		totals = bounds.sum(axis=1)
+		order = np.argsort(totals, kind='stable')
+		best = []
+		kth = np.inf
+		start = 0
+		block_size = first_block_size
+		while start < len(order) and totals[order[start]] <= kth:
+			candidates = order[start:start+block_size]
+			start += len(candidates)
+			block_size = min(2 * block_size, max_block_size)
+			candidates = candidates[totals[candidates] <= kth]
+			block = padded[candidates]
+			partial = np.zeros(len(candidates), dtype=np.int64)
+			remaining = totals[candidates]
+			for first in range(0, size, rows_per_step):
+				last = min(size, first + rows_per_step)
+				partial += row_costs(block, shifts, size, self.context, self.bilevel, first, last).sum(axis=1)
+				remaining = remaining - bounds[candidates, first:last].sum(axis=1)
+				keep = partial + remaining <= kth
+				candidates, block, partial, remaining = \
+					candidates[keep], block[keep], partial[keep], remaining[keep]
+				if len(candidates) == 0:
+					break
+			best = sorted(best + list(zip(partial.tolist(), candidates.tolist())))[:k]
+			if len(best) >= k:
+				kth = best[-1][0]
+		return [self.tokens[i] for _, i in best]
+
+# Compares the pruned with the exhaustive search on the frozen dataset of
+# experiment.py, with bilevel grids:
+#   python3 idm.py [data directory] [grid size] [warp] [context] [k]
+def main():
+	from PIL import Image
+	from graphics import image_to_grid
+	data_dir = sys.argv[1] if len(sys.argv) > 1 else 'data'
+	grid_size, warp, context, k = [int(arg) for arg in sys.argv[2:6]] + [16, 1, 1, 10][len(sys.argv[2:6]):]
+	with open(os.path.join(data_dir, 'index.json'), 'r') as fp:
+		tokens = json.load(fp)
+	grids = [image_to_grid(Image.open(os.path.join(data_dir, token['file'])), grid_size) for token in tokens]
+	n_tests = min(100, len(tokens) // 10)
+	idm = IDM(grid_size, warp, context, True)
+	for grid, token in zip(grids[:-n_tests], tokens[:-n_tests]):
+		idm.add(grid, token)
+	idm.padded_grids()
+	start = time.time()
+	exhaustive = [idm.query_exhaustive(grid, k) for grid in grids[-n_tests:]]
+	exhaustive_time = time.time() - start
+	start = time.time()
+	pruned = [idm.query(grid, k) for grid in grids[-n_tests:]]
+	pruned_time = time.time() - start
+	print('{} references, {} queries, k = {}'.format(len(idm.grids), n_tests, k))
+	print('exhaustive: {:0.2f} ms per query'.format(1000 * exhaustive_time / n_tests))
+	print('pruned: {:0.2f} ms per query; speedup {:0.1f}; same results: {}'.format(\
+		1000 * pruned_time / n_tests, exhaustive_time / pruned_time, pruned == exhaustive))
+
+if __name__ == '__main__':
+	main()
@@ -1,3 +1,8 @@
+import numpy as np
+
+import includemain
+from distortion import pad_grids, distortion_distances
+
 def get_safe(im, x, y, grid_size, bilevel):
 	if x < 0 or x >= grid_size or y < 0 or y >= grid_size:
 		return 1 if bilevel else 255
@@ -29,3 +34,26 @@ def distortion_distance(im1, im2, grid_size, warp=0, context=0, bilevel=False):
 		for y in range(grid_size):										
 			diff += compare_warped(im1, im2, x, y, grid_size, warp, context, bilevel)	
 	return diff
+
+# The vectorised engine in src/python/distortion.py must give the same results
+# as distortion_distance.
+def check_distortion_distances(n_trials=50, grid_size=8, seed=0):
+	rng = np.random.default_rng(seed)
+	for _ in range(n_trials):
+		warp = int(rng.integers(3))
+		context = int(rng.integers(3))
+		bilevel = bool(rng.integers(2))
+		if rng.random() < 0.5:
+			grids = rng.random((5, grid_size, grid_size)) < 0.5
+		else:
+			grids = rng.integers(256, size=(5, grid_size, grid_size), dtype=np.uint8)
+		query = grids[0] if rng.random() < 0.2 else grids[-1]
+		expected = [distortion_distance(grid, query, grid_size, warp=warp, context=context, bilevel=bilevel) \
+			for grid in grids[:-1]]
+		actual = distortion_distances(pad_grids(grids[:-1], context, bilevel), query, grid_size, \
+			warp=warp, context=context, bilevel=bilevel, block_size=int(rng.integers(1, 5)))
+		assert actual.tolist() == expected, (warp, context, bilevel, actual.tolist(), expected)
+	print('distortion_distances agrees with distortion_distance in', n_trials, 'trials')
+
+if __name__ == '__main__':
+	check_distortion_distances()
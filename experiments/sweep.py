@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+from itertools import product
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+from getopt import getopt, GetoptError
+from argparse import Namespace
+
+import experiment
+
+# Runs experiment 1 of experiment.py for every combination of the values of
+# the arguments, as many at a time as there are workers, and adds the results
+# to a SQLite table. Values are separated by commas, as in:
+#   python3 sweep.py -m PCA,IDM -g 20,40 -r None,16 [-j workers] [-e database]
+# Arguments not given keep the defaults of experiment.py. The features all
+# runs need are stored first, so that runs share them through the feature
+# store. The output of each run goes to a log next to its results directory,
+# in SWEEP_DIR. Times depend on the number of workers, which is recorded with
+# them.
+
+SWEEP_DIR = 'sweep'
+DATABASE = os.path.join(SWEEP_DIR, 'results.db')
+
+metrics = ['accuracy', 'top', 'precision', 'recall', 'f', 'train_time', 'token_time']
+
+def open_database(file):
+	connection = sqlite3.connect(file)
+	connection.execute('create table if not exists results (id integer primary key, sweep, run, workers)')
+	existing = {row[1] for row in connection.execute('pragma table_info(results)')}
+	for column in [long for (_, long) in experiment.arguments] + metrics + ['error']:
+		if column not in existing:
+			connection.execute('alter table results add column {}'.format(column))
+	return connection
+
+def store_result(connection, row):
+	columns = list(row)
+	connection.execute('insert into results ({}) values ({})'.format(\
+		', '.join(columns), ', '.join(['?' for _ in columns])), [row[column] for column in columns])
+	connection.commit()
+
+def make_configs(grid):
+	configs = []
+	names = list(grid)
+	for values in product(*[grid[name] for name in names]):
+		args = experiment.default_args()
+		for name, val in zip(names, values):
+			vars(args)[name] = val
+		configs.append(args)
+	return configs
+
+def feature_specs(args):
+	specs = [('grid', args.grid_size)]
+	if args.rerank_grid_size is not None:
+		specs.append(('grid', args.rerank_grid_size))
+	if args.method in ['GlyphNet', 'BGK', 'CNN1', 'CNN2', 'CNN3']:
+		specs.append(('block', args.grid_size))
+	return [(kind, size, args.skeleton, args.center, args.binarize if kind == 'grid' else None) \
+		for (kind, size) in specs]
+
+# Divides the features of all runs among the workers, each kind and size once.
+def feature_tasks(configs, n_workers):
+	files = {}
+	for args in configs:
+		with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+			experiment.set_args(args)
+			tokens = experiment.read_tokens(args)
+		for spec in feature_specs(args):
+			files.setdefault(spec, {})
+			files[spec].update(dict.fromkeys([token['file'] for token in tokens]))
+	tasks = []
+	for (kind, size, skeleton, center, binarize), spec_files in files.items():
+		args = Namespace(skeleton=skeleton, center=center, binarize=binarize)
+		spec_files = list(spec_files)
+		chunk_size = -(-len(spec_files) // n_workers)
+		for start in range(0, len(spec_files), chunk_size):
+			tasks.append((args, spec_files[start:start+chunk_size], kind, size))
+	return tasks
+
+def run(args):
+	with open(args.results_dir + '.log', 'w') as log, redirect_stdout(log):
+		try:
+			experiment.prepare(args)
+			experiment.test_plain()
+			experiment.report()
+			return args, experiment.results(), None
+		except Exception as err:
+			print(repr(err))
+			return args, None, repr(err)
+
+def sweep(grid, n_workers, database=DATABASE):
+	experiment.ensure_exists(SWEEP_DIR)
+	label = time.strftime('%Y%m%d-%H%M%S')
+	configs = make_configs(grid)
+	for i, args in enumerate(configs):
+		args.results_dir = os.path.join(SWEEP_DIR, '{}-{}'.format(label, i))
+		args.model_dir = args.results_dir
+	connection = open_database(database)
+	with Pool(n_workers, maxtasksperchild=1) as pool:
+		start = time.time()
+		pool.starmap(experiment.store_features, feature_tasks(configs, n_workers))
+		print('Storing features took {0:0.1f} sec'.format(time.time() - start))
+		for args, results, error in pool.imap_unordered(run, configs):
+			row = {long: vars(args)[long] for (_, long) in experiment.arguments}
+			row.update({'sweep': label, 'run': os.path.basename(args.results_dir), 'workers': n_workers, 'error': error})
+			if results is not None:
+				row.update(results)
+				row['top'] = json.dumps(results['top'])
+			store_result(connection, row)
+			print(row['run'], 'error: ' + error if error is not None else \
+				'accuracy: {:0.1f} %'.format(100 * results['accuracy']))
+	connection.close()
+
+if __name__ == '__main__':
+	short_args = experiment.short_args + 'j:e:'
+	long_args = experiment.long_args + ['workers=', 'database=']
+	try:
+		opts, vals = getopt(sys.argv[1:], short_args, long_args)
+	except GetoptError as err:
+		print(err)
+		sys.exit(1)
+	grid = {}
+	n_workers = os.cpu_count()
+	database = DATABASE
+	for opt, val in opts:
+		if opt in ['-j', '--workers']:
+			n_workers = int(val)
+		elif opt in ['-e', '--database']:
+			database = val
+		for (short, long) in experiment.arguments:
+			if opt == '-' + short or opt == '--' + long:
+				grid[long] = [experiment.parse_value(v) for v in val.split(',')]
+				break
+	sweep(grid, n_workers, database)
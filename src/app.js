@@ -87,8 +87,15 @@ server.on('error', (error) => {
 	process.exit(1);
 });
 const socket = io(server);
+app.set('io', socket);
 socket.on('connection', (socketServer) => {
 	socketServer.on('npmStop', () => {
 		process.exit(0);
 	});
+	/* Client waiting for the progress of an analysis it is about to request */
+	socketServer.on('watch', (id, done) => {
+		socketServer.join(String(id));
+		if (typeof done == 'function')
+			done();
+	});
 });
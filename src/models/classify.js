@@ -10,6 +10,7 @@ const classifySchema = new Schema({
 	ratio: Number,
 	grid: [[Boolean]],
 	pca: [Number],
+	stamp: [Number],
 }, { collection: 'classify' });
 
 module.exports = mongoose.model('Classify', classifySchema);
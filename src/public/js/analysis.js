@@ -8,8 +8,37 @@ window.addEventListener('DOMContentLoaded',
 			makeFeatureSelection();
 			makeLegend();
 		}
+		watchProgress();
 	});
 
+/* Progress of the requested analysis, pushed by the server while the next
+page is computed */
+function watchProgress() {
+	const form = document.getElementById('analysis-form');
+	if (typeof io != 'function' || !form)
+		return;
+	form.addEventListener('submit', function (event) {
+		event.preventDefault();
+		const id = Date.now().toString(36) + Math.random().toString(36).substring(2);
+		const message = document.getElementById('progress-message');
+		const socket = io();
+		socket.on('progress', function (text) {
+			message.innerText = text;
+			message.classList.remove('hidden');
+		});
+		var submitted = false;
+		const submit = function () {
+			if (!submitted) {
+				submitted = true;
+				document.getElementById('progress').value = id;
+				form.submit();
+			}
+		};
+		socket.emit('watch', id, submit);
+		setTimeout(submit, 2000);
+	});
+}
+
 var embeddingCanvas = null;
 
 function initializeCanvas() {
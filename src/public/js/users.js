@@ -11,7 +11,7 @@ function validate(form) {
 	return true;
 }
 
-function train() {
+function train(incremental) {
 	$('wait').classList.remove('hidden');
-	location.href='../admin/train';
+	location.href = incremental ? '../admin/train?incremental=1' : '../admin/train';
 }
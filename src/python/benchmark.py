@@ -0,0 +1,166 @@
+import sys
+import time
+import numpy as np
+
+from settings import pca_size
+
+# Timings of the classification machinery. The first argument is the benchmark
+# to run:
+#   python3 benchmark.py index [size ...]
+# compares the nearest-neighbour indexes on synthetic embeddings of the given
+# numbers of tokens, reporting build time, query latency and recall@k against
+# brute force.
+#   python3 benchmark.py model
+# compares loading and applying the pickled scikit-learn scaler and PCA with
+# the NumPy projection in model.npz, on a model fitted to random grids.
+#   python3 benchmark.py prototypes [directory]
+# compares exact search for the nearest distinct signs with the two-stage
+# search over per-sign prototypes, reporting top-1 accuracy and query latency
+# on the frozen dataset of the experiments (index.json and images, by default
+# in experiments/data); the last n_tests tokens are queries.
+
+n_queries = 200
+k = 10
+n_tests = 1000
+prefilters = [10, 25, 50, 100]
+
+def synthetic_embeddings(n, n_signs=800, seed=0):
+	rng = np.random.default_rng(seed)
+	centers = rng.normal(scale=10, size=(n_signs, pca_size)).astype(np.float32)
+	labels = rng.integers(n_signs, size=n)
+	return centers[labels] + rng.normal(scale=4, size=(n, pca_size)).astype(np.float32)
+
+def time_queries(index, queries, k):
+	results = []
+	start = time.time()
+	for query in queries:
+		best, _ = index.query(query, k)
+		results.append(best)
+	end = time.time()
+	return results, 1000 * (end-start) / len(queries)
+
+def recall(results, truths):
+	hits = [len(set(result.tolist()) & set(truth.tolist())) for result, truth in zip(results, truths)]
+	return sum(hits) / sum([len(truth) for truth in truths])
+
+def bench_index(sizes):
+	from nearest import make_index
+	methods = ['brute', 'kdtree', 'balltree', 'ivf']
+	print('{:>8} {:>9} {:>10} {:>11} {:>9}'.format('tokens', 'method', 'build s', 'query ms', 'recall'))
+	for n in sizes:
+		matrix = synthetic_embeddings(n)
+		rng = np.random.default_rng(1)
+		queries = matrix[rng.choice(n, n_queries, replace=False)] + \
+			rng.normal(scale=1, size=(n_queries, pca_size)).astype(np.float32)
+		truths = None
+		for method in methods:
+			index = make_index(method)
+			start = time.time()
+			index.build(matrix)
+			build_time = time.time() - start
+			results, latency = time_queries(index, queries, k)
+			if truths is None:
+				truths = results
+			print('{:>8} {:>9} {:>10.2f} {:>11.3f} {:>9.3f}'.format(\
+				n, method, build_time, latency, recall(results, truths)))
+
+def time_startup(code, n=5):
+	import subprocess
+	start = time.time()
+	for _ in range(n):
+		subprocess.run([sys.executable, '-c', code], check=True)
+	return 1000 * (time.time() - start) / n
+
+def bench_model():
+	import os
+	import pickle
+	import tempfile
+	from sklearn.preprocessing import StandardScaler
+	from sklearn.decomposition import PCA
+	from settings import grid_size
+	from graphics import export_projection, load_projection, vector_to_embedding
+	rng = np.random.default_rng(0)
+	vectors = rng.random((2000, grid_size * grid_size)) < 0.3
+	scaler = StandardScaler().fit(vectors)
+	pca = PCA(n_components=pca_size).fit(scaler.transform(vectors))
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		scaler_file = os.path.join(tmp_dir, 'scaler.pickle')
+		pca_file = os.path.join(tmp_dir, 'pca.pickle')
+		npz_file = os.path.join(tmp_dir, 'model.npz')
+		with open(scaler_file, 'wb') as handle:
+			pickle.dump(scaler, handle)
+		with open(pca_file, 'wb') as handle:
+			pickle.dump(pca, handle)
+		export_projection(npz_file, scaler, pca)
+		baseline = time_startup('pass')
+		pickle_start = time_startup('import pickle; pickle.load(open({!r}, "rb")); pickle.load(open({!r}, "rb"))'.format(\
+			scaler_file, pca_file))
+		npz_start = time_startup('import numpy as np; np.load({!r})["components"]'.format(npz_file))
+		projection = load_projection(npz_file)
+	queries = vectors[:n_queries]
+	start = time.time()
+	for vector in queries:
+		old = pca.transform(scaler.transform([vector]))[0]
+	old_latency = 1000 * (time.time() - start) / len(queries)
+	start = time.time()
+	for vector in queries:
+		new = vector_to_embedding(vector, projection)
+	new_latency = 1000 * (time.time() - start) / len(queries)
+	difference = np.max(np.abs(pca.transform(scaler.transform(queries)) - projection.transform(queries)))
+	print('{:>10} {:>17} {:>11}'.format('model', 'process start ms', 'query ms'))
+	print('{:>10} {:>17.1f} {:>11.3f}'.format('pickle', pickle_start, old_latency))
+	print('{:>10} {:>17.1f} {:>11.3f}'.format('npz', npz_start, new_latency))
+	print('(interpreter alone: {:0.1f} ms; largest difference: {:0.2e})'.format(baseline, difference))
+
+def bench_prototypes(data_dir):
+	import os
+	import json
+	from sklearn.preprocessing import StandardScaler
+	from sklearn.decomposition import PCA
+	from features import extract_all, unpack_grid
+	from references import References
+	from prepare import prototype_rows
+	with open(os.path.join(data_dir, 'index.json'), 'r') as handle:
+		tokens = json.load(handle)
+	features = extract_all([os.path.join(data_dir, token['file']) for token in tokens])
+	vectors = np.array([unpack_grid(packed).flatten() for _, packed in features])
+	signs = np.array([token['sign'] for token in tokens], dtype=object)
+	n_train = len(tokens) - min(n_tests, len(tokens) // 5)
+	scaler = StandardScaler().fit(vectors[:n_train])
+	pca = PCA(n_components=pca_size).fit(scaler.transform(vectors[:n_train]))
+	embeddings = pca.transform(scaler.transform(vectors)).astype(np.float32)
+	refs = References((signs[:n_train], np.zeros((n_train, 4), dtype=np.int32), embeddings[:n_train]))
+	start = time.time()
+	refs.prototype_rows = prototype_rows(refs)
+	print('k-medoids of {} signs took {:0.1f} sec'.format(len(refs.sign_names), time.time() - start))
+	queries = embeddings[n_train:]
+	truths = signs[n_train:]
+	configurations = [('exact', None)] + \
+		[(prototype, prefilter) for prototype in ['centroid', 'medoid', 'kmedoids'] for prefilter in prefilters]
+	print('{:>9} {:>10} {:>9} {:>11}'.format('prototype', 'prefilter', 'accuracy', 'query ms'))
+	for prototype, prefilter in configurations:
+		if prefilter is not None:
+			refs.sign_prototypes(prototype)
+		start = time.time()
+		best = [refs.nearest_signs(query, 1, prefilter, prototype)[0] for query in queries]
+		latency = 1000 * (time.time() - start) / len(queries)
+		accuracy = np.mean(refs.signs[best] == truths)
+		print('{:>9} {:>10} {:>9.3f} {:>11.3f}'.format(prototype, str(prefilter), accuracy, latency))
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		print('First argument is the benchmark to run')
+		exit(0)
+	match sys.argv[1]:
+		case 'index':
+			sizes = [int(arg) for arg in sys.argv[2:]] or [10000, 100000, 1000000]
+			bench_index(sizes)
+		case 'model':
+			bench_model()
+		case 'prototypes':
+			from settings import root_dir
+			import os
+			data_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join(root_dir, 'experiments', 'data')
+			bench_prototypes(data_dir)
+		case _:
+			print('Unknown benchmark', sys.argv[1])
@@ -1,80 +1,151 @@
 import os
 import pickle
-import heapq
 import sys
+import time
+import numpy as np
 from PIL import Image
 
-from settings import scaler_pickle, pca_pickle, glyph_file
-from database import classify_collection
-from graphics import image_to_ratio, image_to_grid, vector_to_embedding
+from settings import scaler_pickle, pca_pickle, model_npz, glyph_file, cascade, shortlist_size, \
+	rerank_grid_size, rerank_warp, rerank_context, shortlist_budget, rerank_budget
+from database import text_collection
+from references import get_references
+from features import extract_all, unpack_grid
+from graphics import image_to_ratio, image_to_grid, vector_to_embedding, Projection, load_projection
+from distortion import pad_grids, distortion_distances
+
+rerank_block_size = 32
 
 def get_pca():
+	if os.path.exists(model_npz):
+		return load_projection(model_npz)
 	with open(scaler_pickle, 'rb') as handle:
 		scaler = pickle.load(handle)
 	with open(pca_pickle, 'rb') as handle:
 		pca = pickle.load(handle)
-	return scaler, pca
+	return Projection(scaler.mean_, scaler.scale_, pca.mean_, pca.components_)
 
-def image_properties(image, scaler, pca):
+def image_properties(image, model):
 	ratio = image_to_ratio(image)
 	grid = image_to_grid(image)
-	vector = grid.flatten().tolist()
-	pca_val = vector_to_embedding(vector, scaler, pca).tolist()
+	vector = grid.flatten()
+	pca_val = vector_to_embedding(vector, model)
 	return ratio, grid, pca_val
 
 def squared_distance(vals1, vals2):
 	return sum([(val1-val2)*(val1-val2) for (val1,val2) in zip(vals1,vals2)])
 
-def filter_distance(olds, oldSelector, curr, currSelector, distance, best_n):
-	currVal = currSelector(curr)
-	distances = [distance(oldSelector(old), currVal) for old in olds]
-	if best_n == 1:
-		best = [min(range(len(olds)), key=lambda i : distances[i])]
-	else:
-		best = heapq.nsmallest(best_n, range(len(olds)), key=lambda i : distances[i])
-	return [olds[i] for i in best]
-
-def find_best_in(ratio, grid, pca, olds, n):
-	current = { 'ratio': ratio, 'grid': grid, 'pca': pca }
-	return filter_distance(olds, lambda o : o['pca'], current, lambda c : c['pca'], squared_distance, n)
-
-def find_best(ratio, grid, pca):
-	olds = list(classify_collection.find({}))
-	return find_best_in(ratio, grid, pca, olds, 1)[0]['sign']
-
-def classify(image):
-	scaler, pca = get_pca()
-	ratio, grid, pca_val = image_properties(image, scaler, pca)
-	return find_best(ratio, grid, pca_val)
-
-def best_candidates(candidates, k):
-	best = []
-	best_signs = []
-	i = 0
-	while len(best_signs) < k and i < len(candidates):
-		candidate = candidates[i]
-		sign = candidate['sign']
-		if sign not in best_signs:
-			best_signs.append(sign)
-			best.append(candidate)
-		i += 1
-	return best
+def find_best(ratio, grid, pca, refs=None):
+	if refs is None:
+		refs = get_references()
+	return refs.signs[refs.nearest(pca, 1)[0]]
+
+def classify(image, model=None, refs=None):
+	model = model if model is not None else get_pca()
+	ratio, grid, pca_val = image_properties(image, model)
+	if cascade:
+		refs = refs if refs is not None else get_references()
+		return cascade_distribution(image_to_grid(image, rerank_grid_size), pca_val, 1, refs)[0]['name']
+	return find_best(ratio, grid, pca_val, refs=refs)
 
 def make_pca_distribution(pca, candidates):
 	unnorm = [{ 'name': c['sign'], 'weight': 1/squared_distance(pca, c['pca']) } for c in candidates]
 	w = sum([c['weight'] for c in unnorm])
 	return [{ 'name': c['name'], 'portion': round(100 * c['weight'] / w) } for c in unnorm]
 
-def find_best_k_distribution(ratio, grid, pca, k):
-	olds = list(classify_collection.find({}))
-	olds = find_best_in(ratio, grid, pca, olds, len(olds))
-	best = best_candidates(olds, k)
+def find_best_k_distribution(ratio, grid, pca, k, refs=None):
+	if refs is None:
+		refs = get_references()
+	best = list(refs.candidates(refs.nearest_signs(pca, k)))
 	return make_pca_distribution(pca, best)
 
-def classify_distribution(image, k):
-	scaler, pca = get_pca()
-	ratio, grid, pca_val = image_properties(image, scaler, pca)
-	return find_best_k_distribution(ratio, grid, pca_val, k)
+def classify_distribution(image, k, model=None, refs=None):
+	model = model if model is not None else get_pca()
+	ratio, grid, pca_val = image_properties(image, model)
+	if cascade:
+		refs = refs if refs is not None else get_references()
+		return cascade_distribution(image_to_grid(image, rerank_grid_size), pca_val, k, refs)
+	return find_best_k_distribution(ratio, grid, pca_val, k, refs=refs)
+
+# Rows of the shortlist in order of image distortion distance to the query
+# grid, with these distances, in blocks of nearest candidates by embedding
+# until rerank_budget is spent. The first n_keep rows are always re-ranked.
+def rerank(query, shortlist, refs, n_keep=0):
+	start = time.time()
+	dists = []
+	for block_start in range(0, len(shortlist), rerank_block_size):
+		if block_start >= max(n_keep, 1) and 1000 * (time.time() - start) > rerank_budget:
+			break
+		rows = shortlist[block_start:block_start+rerank_block_size]
+		padded = pad_grids(refs.rerank_grids_of(rows), rerank_context, True)
+		dists.append(distortion_distances(padded, query, rerank_grid_size,
+			warp=rerank_warp, context=rerank_context, bilevel=True))
+	dists = np.concatenate(dists) if len(dists) > 0 else np.empty(0, dtype=np.int64)
+	order = np.argsort(dists, kind='stable')
+	return shortlist[:len(dists)][order], dists[order]
+
+def make_distortion_distribution(names, dists):
+	weights = 1 / (np.asarray(dists, dtype=float) + 1)
+	return [{ 'name': name, 'portion': round(100 * w / weights.sum()) } for name, w in zip(names, weights)]
+
+# Two-stage classification: a shortlist by embedding re-ranked by image
+# distortion distance. The shortlist starts with the nearest token of each of
+# the k nearest signs, so that as many signs are ranked as without the
+# cascade, followed by the other of the shortlist_size nearest tokens. Without
+# re-ranking grids for the current references, or if the shortlist exceeds
+# its budget, the ranking by embedding is used.
+def cascade_distribution(query, pca, k, refs):
+	start = time.time()
+	sign_rows = refs.nearest_signs(pca, k)
+	nearest = refs.nearest(pca, shortlist_size)
+	shortlist = np.r_[sign_rows, nearest[~np.isin(nearest, sign_rows)]]
+	if refs.rerank_grids is None or 1000 * (time.time() - start) > shortlist_budget:
+		return make_pca_distribution(pca, list(refs.candidates(sign_rows)))
+	rows, dists = rerank(query, shortlist, refs, len(sign_rows))
+	_, first = np.unique(refs.signs[rows], return_index=True)
+	first = np.sort(first)[:k]
+	return make_distortion_distribution(refs.signs[rows[first]], dists[first])
+
+def line_coordinates(text, page, line=None, unnamed=False):
+	record = text_collection.find_one({ 'index': int(text) }, { 'index': 1, 'pages': 1 })
+	if record is None:
+		return []
+	coords = []
+	for p in record['pages']:
+		if p['index'] != int(page):
+			continue
+		for l in p['lines']:
+			if line is not None and l['index'] != int(line):
+				continue
+			for g in l['glyphs']:
+				if not unnamed or not g.get('name'):
+					coords.append((record['index'], p['index'], l['index'], g['index']))
+	return coords
+
+# Classifies many glyphs at once: images are decoded in parallel, embedded
+# as one matrix and compared with all references in matrix products.
+def classify_batch(coords, k, model=None, refs=None):
+	model = model if model is not None else get_pca()
+	refs = refs if refs is not None else get_references()
+	results = [{ 'text': c[0], 'page': c[1], 'line': c[2], 'glyph': c[3] } for c in coords]
+	files = [glyph_file(*c) for c in coords]
+	found = [i for i, file in enumerate(files) if os.path.exists(file)]
+	for i in range(len(results)):
+		results[i]['candidates'] = []
+	if len(found) == 0:
+		return results
+	features = extract_all([files[i] for i in found])
+	vectors = np.array([unpack_grid(packed).flatten() for _, packed in features])
+	embeddings = model.transform(vectors)
+	if cascade:
+		grids = extract_all([files[i] for i in found], rerank_grid_size)
+		for i, embedding, (_, packed) in zip(found, embeddings, grids):
+			query = unpack_grid(packed, rerank_grid_size)
+			results[i]['candidates'] = cascade_distribution(query, embedding, k, refs)
+		return results
+	for i, embedding, dists in zip(found, embeddings, refs.batch_distances(embeddings)):
+		best = list(refs.candidates(refs.nearest_signs_in(dists[refs.sign_order], k)))
+		results[i]['candidates'] = make_pca_distribution(embedding, best)
+	return results
 
 def main():
 	text = sys.argv[1]
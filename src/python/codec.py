@@ -0,0 +1,40 @@
+import numpy as np
+from bson.binary import Binary
+
+from settings import grid_size, compact_storage
+
+# Grids and PCA vectors in the classify collection are either lists (plain
+# schema) or binary (compact schema): bit-packed grids and float32 vectors.
+# Decoding accepts both.
+
+def encode_grid(grid, compact=compact_storage):
+	grid = np.asarray(grid, dtype=bool)
+	if compact:
+		return Binary(np.packbits(grid).tobytes())
+	else:
+		return grid.tolist()
+
+def decode_grid(value):
+	if isinstance(value, bytes):
+		packed = np.frombuffer(value, dtype=np.uint8)
+		return np.unpackbits(packed, count=grid_size*grid_size).reshape(grid_size, grid_size).astype(bool)
+	else:
+		return np.array(value, dtype=bool)
+
+def encode_pca(pca, compact=compact_storage):
+	if compact:
+		return Binary(np.asarray(pca, dtype=np.float32).tobytes())
+	else:
+		return np.asarray(pca).tolist()
+
+def decode_pca(value):
+	if isinstance(value, bytes):
+		return np.frombuffer(value, dtype=np.float32)
+	else:
+		return np.array(value, dtype=np.float32)
+
+def decode_pcas(values, size):
+	if len(values) > 0 and all(isinstance(value, bytes) for value in values):
+		return np.frombuffer(b''.join(values), dtype=np.float32).reshape(-1, size)
+	else:
+		return np.array([decode_pca(value) for value in values], dtype=np.float32).reshape(-1, size)
@@ -0,0 +1,75 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Image distortion distance between grids: each pixel of the reference may be
+# matched to any pixel of the query within warp, comparing windows of context
+# around both; outside the grids, pixels are white. One query is scored
+# against a batch of references; the scalar version it agrees with is in
+# experiments/imagedistortion.py. Reference grids are padded once by the
+# context, with pad_grids; the query is padded by warp and context, and its
+# shifted views for all warp offsets form one stack. The squared differences
+# are summed over context windows, first along rows and then along columns,
+# and minimized over warp offsets. Costs can be computed per pixel row, and
+# bounded from below per row, for searches that abandon a reference early.
+
+def pad_grids(grids, margin, bilevel):
+	grids = np.asarray(grids).astype(np.int32)
+	fill = 1 if bilevel else 255
+	pad_width = [(0, 0)] * (grids.ndim - 2) + [(margin, margin)] * 2
+	return np.pad(grids, pad_width, constant_values=fill)
+
+def max_pixel_cost(context, bilevel):
+	window = 1 + 2 * context
+	return window * window * (1 if bilevel else 255*255)
+
+# Sums over windows of size window along the last two axes, rows then columns.
+def box_sum(values, window, n_rows, n_cols):
+	rows = values[..., :n_rows, :].copy()
+	for i in range(1, window):
+		rows += values[..., i:i+n_rows, :]
+	sums = rows[..., :n_cols].copy()
+	for i in range(1, window):
+		sums += rows[..., i:i+n_cols]
+	return sums
+
+# Views of the padded query, one for each warp offset, each of the size of a
+# reference grid padded by the context.
+def shifted_queries(query, grid_size, warp, context, bilevel):
+	span = grid_size + 2 * context
+	return sliding_window_view(pad_grids(query, warp + context, bilevel), (span, span))
+
+# Costs of pixel rows first to last of padded reference grids, one sum per row.
+def row_costs(padded, shifts, grid_size, context, bilevel, first=0, last=None):
+	last = grid_size if last is None else last
+	window = 1 + 2 * context
+	squares = padded[:, None, None, first:last+2*context] - shifts[None, :, :, first:last+2*context]
+	squares *= squares
+	costs = box_sum(squares, window, last - first, grid_size)
+	best = np.minimum(costs.min(axis=(1, 2)), max_pixel_cost(context, bilevel))
+	return best.sum(axis=2, dtype=np.int64)
+
+# image distortion distances between padded reference grids and a query, as
+# distortion_distance(reference, query)
+def distortion_distances(padded, query, grid_size, warp=0, context=0, bilevel=False, block_size=256):
+	shifts = shifted_queries(query, grid_size, warp, context, bilevel)
+	diffs = np.empty(len(padded), dtype=np.int64)
+	for start in range(0, len(padded), block_size):
+		block = padded[start:start+block_size]
+		diffs[start:start+len(block)] = row_costs(block, shifts, grid_size, context, bilevel).sum(axis=1)
+	return diffs
+
+# Lower and upper envelope of the padded query: the least and greatest value
+# within warp of each pixel of a reference grid padded by the context.
+def warp_envelope(query, grid_size, warp, context, bilevel):
+	window = 1 + 2 * warp
+	windows = sliding_window_view(pad_grids(query, warp + context, bilevel), (window, window))
+	return windows.min(axis=(2, 3)), windows.max(axis=(2, 3))
+
+# Lower bounds of the row costs of padded reference grids. Whatever the warp,
+# a reference pixel is compared with a query value within the envelope, so it
+# costs at least its squared distance to the envelope.
+def row_lower_bounds(padded, lower, upper, grid_size, context, bilevel):
+	excess = np.maximum(padded - upper, 0) + np.maximum(lower - padded, 0)
+	excess *= excess
+	costs = box_sum(excess, 1 + 2 * context, grid_size, grid_size)
+	return np.minimum(costs, max_pixel_cost(context, bilevel)).sum(axis=2, dtype=np.int64)
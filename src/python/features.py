@@ -0,0 +1,73 @@
+import os
+import pickle
+import numpy as np
+from functools import partial
+from multiprocessing import Pool
+from PIL import Image
+
+from settings import grid_size, feature_cache, n_workers, chunk_size
+from graphics import image_to_ratio, image_to_grid
+
+# Ratio and grid of glyph images, cached on disk by file path, modification
+# time and size, so that unchanged images are decoded only once.
+
+def file_stamp(file):
+	stat = os.stat(file)
+	return (stat.st_mtime_ns, stat.st_size)
+
+def pack_grid(grid):
+	return np.packbits(grid)
+
+def unpack_grid(packed, size=grid_size):
+	return np.unpackbits(packed, count=size*size).reshape(size, size).astype(bool)
+
+def extract_features(file, size=grid_size):
+	image = Image.open(file)
+	return image_to_ratio(image), pack_grid(image_to_grid(image, size))
+
+class FeatureCache:
+	def __init__(self, file=feature_cache, size=grid_size):
+		self.file = file
+		self.size = size
+		self.entries = {}
+		try:
+			with open(file, 'rb') as handle:
+				stored = pickle.load(handle)
+			if stored['grid_size'] == size:
+				self.entries = stored['entries']
+		except (FileNotFoundError, EOFError, pickle.UnpicklingError, KeyError):
+			pass
+
+	def get(self, file, stamp=None):
+		entry = self.entries.get(file)
+		if entry is None:
+			return None
+		stamp = stamp if stamp is not None else file_stamp(file)
+		return entry[1] if entry[0] == stamp else None
+
+	def put(self, file, stamp, features):
+		self.entries[file] = (stamp, features)
+
+	def save(self):
+		tmp_file = self.file + '.tmp'
+		with open(tmp_file, 'wb') as handle:
+			pickle.dump({ 'grid_size': self.size, 'entries': self.entries }, handle)
+		os.replace(tmp_file, self.file)
+
+def extract_all(files, size=grid_size):
+	if n_workers > 1 and len(files) > chunk_size:
+		with Pool(n_workers) as pool:
+			return pool.map(partial(extract_features, size=size), files, chunksize=chunk_size)
+	else:
+		return [extract_features(file, size) for file in files]
+
+def file_features(files, cache=None):
+	cache = cache if cache is not None else FeatureCache()
+	stamps = { file: file_stamp(file) for file in set(files) }
+	missing = [file for file, stamp in stamps.items() if cache.get(file, stamp) is None]
+	if len(missing) > 0:
+		extracted = extract_all(missing, cache.size)
+		for file, features in zip(missing, extracted):
+			cache.put(file, stamps[file], features)
+		cache.save()
+	return [cache.get(file, stamps[file]) for file in files]
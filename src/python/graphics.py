@@ -13,14 +13,34 @@ def image_to_ratio(image):
 	width, height = image.size
 	return width / height
 
-def image_to_grid(image):
+def image_to_grid(image, size=grid_size):
 	image = add_background(image)
-	resized = image.resize((grid_size, grid_size))
+	resized = image.resize((size, size))
 	bilevel = resized.convert('1')
 	grid = np.asarray(bilevel)
 	return grid
 
-def vector_to_embedding(vector, scaler, red):
-	scaled = scaler.transform([vector])[0]
-	return red.transform([scaled])[0]
+# Standardization followed by PCA, fused into one affine map:
+# ((x - mean) / scale - pca_mean) @ components.T = x @ weights - offset
+# The version is that of the references embedded with it, if known.
+class Projection:
+	def __init__(self, mean, scale, pca_mean, components, version=None):
+		self.version = version
+		self.weights = np.ascontiguousarray((components / scale).T)
+		self.offset = (mean / scale + pca_mean) @ components.T
+
+	def transform(self, vectors):
+		return np.asarray(vectors, dtype=np.float64) @ self.weights - self.offset
+
+def export_projection(file, scaler, red, version=None):
+	np.savez(file, mean=scaler.mean_, scale=scaler.scale_, pca_mean=red.mean_, components=red.components_,
+		version=str(version))
+
+def load_projection(file):
+	with np.load(file) as arrays:
+		version = str(arrays['version']) if 'version' in arrays.files and str(arrays['version']) != 'None' else None
+		return Projection(arrays['mean'], arrays['scale'], arrays['pca_mean'], arrays['components'], version)
+
+def vector_to_embedding(vector, projection):
+	return projection.transform(vector)
 
@@ -3,22 +3,32 @@ import json
 import re
 from binascii import a2b_base64
 from io import BytesIO
-import base64
-from PIL import Image, ImageOps
+import numpy as np
+from PIL import Image
 
 from classification import classify_distribution
 
-def classify(sign):
+n_candidates = 7
+
+# The drawing canvas is filled with opaque white, so the alpha channel is of
+# no use; the bounding box is that of pixels that are not white, found on the
+# grey levels. Only the cropped part is converted to RGB.
+def drawing_to_image(sign):
 	imgstr = re.search(r'base64,(.*)', sign).group(1)
 	image = Image.open(BytesIO(a2b_base64(imgstr)))
-	image = image.convert('RGB')
-	inverted = ImageOps.invert(image)
-	bbox = inverted.getbbox()
-	if not bbox:
+	ink = np.asarray(image.convert('L')) < 255
+	rows = np.flatnonzero(ink.any(axis=1))
+	if len(rows) == 0:
+		return None
+	cols = np.flatnonzero(ink.any(axis=0))
+	return image.crop((cols[0], rows[0], cols[-1] + 1, rows[-1] + 1)).convert('RGB')
+
+def classify(sign, model=None, refs=None):
+	image = drawing_to_image(sign)
+	if image is None:
 		return []
 	else:
-		image = image.crop(bbox)
-		return classify_distribution(image, 7)
+		return classify_distribution(image, n_candidates, model=model, refs=refs)
 
 def main():
 	sign = sys.argv[1]
@@ -0,0 +1,94 @@
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from sklearn.neighbors import NearestNeighbors
+
+from nearest import squared_norms
+
+# Landmark MDS and landmark (Nystrom) Isomap, after de Silva and Tenenbaum.
+# Classical scaling is applied to the distances between m landmarks only, and
+# every other point is triangulated from its distances to the landmarks, so
+# memory is O(n*m) rather than O(n*n). Both have the fit_transform and
+# transform of scikit-learn reducers.
+
+block_size = 1000
+
+def squared_distances(vecs, landmarks):
+	norms = squared_norms(landmarks)
+	dists = np.empty((len(vecs), len(landmarks)), dtype=np.float32)
+	for start in range(0, len(vecs), block_size):
+		block = vecs[start:start+block_size]
+		dists[start:start+len(block)] = \
+			np.maximum(norms - 2 * (block @ landmarks.T) + squared_norms(block)[:, None], 0)
+	return dists
+
+# Each next landmark is the point farthest from the landmarks chosen so far.
+def maxmin_landmarks(vecs, m, seed=0):
+	n = len(vecs)
+	norms = squared_norms(vecs)
+	chosen = [int(np.random.default_rng(seed).integers(n))]
+	nearest = np.full(n, np.inf, dtype=np.float32)
+	while len(chosen) < min(m, n):
+		last = vecs[chosen[-1]]
+		nearest = np.minimum(nearest, np.maximum(norms - 2 * (vecs @ last) + last @ last, 0))
+		farthest = int(np.argmax(nearest))
+		if nearest[farthest] <= 0:
+			break
+		chosen.append(farthest)
+	return np.array(chosen)
+
+class LandmarkMDS:
+	def __init__(self, n_components=2, n_landmarks=500):
+		self.n_components = n_components
+		self.n_landmarks = n_landmarks
+
+	def fit(self, vecs):
+		self.fit_transform(vecs)
+		return self
+
+	def fit_transform(self, vecs):
+		vecs = np.asarray(vecs, dtype=np.float32)
+		self.landmarks = vecs[maxmin_landmarks(vecs, self.n_landmarks)]
+		self.scale(squared_distances(self.landmarks, self.landmarks))
+		return self.transform(vecs)
+
+	def transform(self, vecs):
+		return self.triangulate(squared_distances(np.asarray(vecs, dtype=np.float32), self.landmarks))
+
+	def scale(self, dists):
+		self.means = dists.mean(axis=0)
+		centered = dists - self.means - dists.mean(axis=1)[:, None] + self.means.mean()
+		values, vectors = np.linalg.eigh(-centered / 2)
+		top = np.argsort(values)[::-1][:self.n_components]
+		self.pseudo_inverse = vectors[:, top] / np.sqrt(np.maximum(values[top], 1e-12))
+
+	def triangulate(self, dists):
+		return (-(dists - self.means) @ self.pseudo_inverse / 2).astype(np.float32)
+
+# Geodesic distances along the graph of n_neighbors nearest neighbours, from
+# the landmarks only. New points reach the landmarks through their nearest
+# neighbours among the fitted points.
+class LandmarkIsomap(LandmarkMDS):
+	def __init__(self, n_components=2, n_landmarks=500, n_neighbors=5):
+		super().__init__(n_components, n_landmarks)
+		self.n_neighbors = n_neighbors
+
+	def fit_transform(self, vecs):
+		vecs = np.asarray(vecs, dtype=np.float32)
+		self.neighbours = NearestNeighbors(n_neighbors=min(self.n_neighbors, len(vecs) - 1)).fit(vecs)
+		graph = self.neighbours.kneighbors_graph(mode='distance')
+		landmarks = maxmin_landmarks(vecs, self.n_landmarks)
+		geodesics = dijkstra(graph, directed=False, indices=landmarks)
+		finite = np.isfinite(geodesics)
+		geodesics[~finite] = geodesics[finite].max() if finite.any() else 0
+		self.geodesics = np.ascontiguousarray(geodesics.T, dtype=np.float32)
+		self.scale(self.geodesics[landmarks] ** 2)
+		return self.triangulate(self.geodesics ** 2)
+
+	def transform(self, vecs):
+		vecs = np.asarray(vecs, dtype=np.float32)
+		embeds = np.empty((len(vecs), self.n_components), dtype=np.float32)
+		for start in range(0, len(vecs), block_size):
+			dists, neighbours = self.neighbours.kneighbors(vecs[start:start+block_size])
+			geodesics = (dists[:, :, None] + self.geodesics[neighbours]).min(axis=1)
+			embeds[start:start+len(geodesics)] = self.triangulate(geodesics ** 2)
+		return embeds
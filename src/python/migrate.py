@@ -0,0 +1,34 @@
+import sys
+from pymongo import UpdateOne
+
+from settings import store_batch_size
+from database import classify_collection
+from codec import encode_grid, decode_grid, encode_pca, decode_pca
+
+# Converts the classify collection between the plain schema (lists) and the
+# compact schema (binary). Set compact_storage in settings.py accordingly.
+
+def migrate(compact):
+	n_converted = 0
+	ops = []
+	for old in classify_collection.find({}, { 'grid': 1, 'pca': 1 }):
+		grid = encode_grid(decode_grid(old['grid']), compact=compact)
+		pca = encode_pca(decode_pca(old['pca']), compact=compact)
+		ops.append(UpdateOne({ '_id': old['_id'] }, { '$set': { 'grid': grid, 'pca': pca } }))
+		if len(ops) >= store_batch_size:
+			classify_collection.bulk_write(ops, ordered=False)
+			n_converted += len(ops)
+			ops = []
+	if len(ops) > 0:
+		classify_collection.bulk_write(ops, ordered=False)
+		n_converted += len(ops)
+	print('Converted', n_converted, 'glyphs')
+
+def main():
+	if len(sys.argv) < 2 or sys.argv[1] not in ['compact', 'expand']:
+		print('python3 migrate.py compact|expand')
+		sys.exit(2)
+	migrate(sys.argv[1] == 'compact')
+
+if __name__ == '__main__':
+	main()
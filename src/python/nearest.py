@@ -0,0 +1,168 @@
+import math
+import pickle
+import numpy as np
+
+from settings import index_method, index_pickle, ivf_lists, ivf_probes
+
+# Nearest-neighbour indexes over the rows of a float32 matrix. Each query
+# returns row indexes and squared distances, nearest first.
+
+def squared_norms(matrix):
+	return np.einsum('ij,ij->i', matrix, matrix)
+
+def top_k(dists, k):
+	k = min(k, len(dists))
+	if k == 0:
+		return np.empty(0, dtype=np.intp)
+	if k < len(dists):
+		best = np.argpartition(dists, k-1)[:k]
+	else:
+		best = np.arange(len(dists))
+	return best[np.argsort(dists[best], kind='stable')]
+
+class Index:
+	def build(self, matrix):
+		self.attach(matrix)
+
+	def attach(self, matrix):
+		self.matrix = matrix
+		self.norms = squared_norms(matrix)
+
+	def distances(self, vector):
+		dists = self.norms - 2 * (self.matrix @ vector) + vector @ vector
+		return np.maximum(dists, 0)
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state.pop('matrix', None)
+		state.pop('norms', None)
+		return state
+
+# Exact linear scan.
+class BruteForceIndex(Index):
+	def query(self, vector, k):
+		vector = np.asarray(vector, dtype=np.float32)
+		dists = self.distances(vector)
+		best = top_k(dists, k)
+		return best, dists[best]
+
+# Exact search in a KD-tree (SciPy) or ball tree (scikit-learn).
+class TreeIndex(Index):
+	def __init__(self, kind):
+		self.kind = kind
+
+	def build(self, matrix):
+		super().build(matrix)
+		if self.kind == 'kdtree':
+			from scipy.spatial import cKDTree
+			self.tree = cKDTree(matrix)
+		else:
+			from sklearn.neighbors import BallTree
+			self.tree = BallTree(matrix)
+
+	def query(self, vector, k):
+		k = min(k, len(self.matrix))
+		if k == 0:
+			return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+		vector = np.asarray(vector, dtype=np.float32)
+		if self.kind == 'kdtree':
+			dists, best = self.tree.query(vector, k=k)
+		else:
+			dists, best = self.tree.query([vector], k=k)
+			dists, best = dists[0], best[0]
+		best = np.atleast_1d(best)
+		dists = np.atleast_1d(dists)
+		return best, dists * dists
+
+# Approximate search with an inverted file: rows are bucketed by their nearest
+# k-means centroid, and a query only scans the buckets of its nearest
+# centroids. With the number of buckets growing as the square root of the
+# number of rows, the cost of a query grows much slower than the corpus.
+class IVFIndex(Index):
+	def __init__(self, n_lists=None, n_probes=8, n_iter=10, batch=65536, seed=0):
+		self.n_lists = n_lists
+		self.n_probes = n_probes
+		self.n_iter = n_iter
+		self.batch = batch
+		self.seed = seed
+
+	def assign(self, matrix, centroids):
+		centroid_norms = squared_norms(centroids)
+		assignment = np.empty(len(matrix), dtype=np.intp)
+		for start in range(0, len(matrix), self.batch):
+			block = matrix[start:start+self.batch]
+			dists = centroid_norms - 2 * (block @ centroids.T)
+			assignment[start:start+self.batch] = np.argmin(dists, axis=1)
+		return assignment
+
+	def train(self, matrix, n_lists):
+		rng = np.random.default_rng(self.seed)
+		n_sample = min(len(matrix), 32 * n_lists)
+		sample = matrix[rng.choice(len(matrix), n_sample, replace=False)]
+		centroids = sample[rng.choice(n_sample, n_lists, replace=False)].copy()
+		for _ in range(self.n_iter):
+			assignment = self.assign(sample, centroids)
+			counts = np.bincount(assignment, minlength=n_lists)
+			sums = np.zeros_like(centroids)
+			np.add.at(sums, assignment, sample)
+			filled = counts > 0
+			centroids[filled] = sums[filled] / counts[filled, None]
+		return centroids
+
+	def build(self, matrix):
+		super().build(matrix)
+		n = len(matrix)
+		if n == 0:
+			self.centroids = np.zeros((0, matrix.shape[1]), dtype=np.float32)
+			self.centroid_norms = squared_norms(self.centroids)
+			self.ids = np.empty(0, dtype=np.intp)
+			self.offsets = np.zeros(1, dtype=np.intp)
+			self.vectors = matrix
+			self.vector_norms = squared_norms(matrix)
+			return
+		n_lists = self.n_lists if self.n_lists else round(4 * math.sqrt(n))
+		n_lists = max(1, min(n_lists, n))
+		self.centroids = self.train(matrix, n_lists)
+		self.centroid_norms = squared_norms(self.centroids)
+		assignment = self.assign(matrix, self.centroids)
+		self.ids = np.argsort(assignment, kind='stable')
+		counts = np.bincount(assignment, minlength=n_lists)
+		self.offsets = np.concatenate(([0], np.cumsum(counts)))
+		self.vectors = np.ascontiguousarray(matrix[self.ids])
+		self.vector_norms = squared_norms(self.vectors)
+
+	def query(self, vector, k):
+		vector = np.asarray(vector, dtype=np.float32)
+		if len(self.ids) == 0:
+			return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+		centroid_dists = self.centroid_norms - 2 * (self.centroids @ vector)
+		probes = top_k(centroid_dists, self.n_probes)
+		rows = np.concatenate([np.arange(self.offsets[p], self.offsets[p+1]) for p in probes])
+		block = self.vectors[rows]
+		dists = np.maximum(self.vector_norms[rows] - 2 * (block @ vector) + vector @ vector, 0)
+		best = top_k(dists, k)
+		return self.ids[rows[best]], dists[best]
+
+def make_index(method=index_method):
+	if method == 'brute':
+		return BruteForceIndex()
+	elif method in ['kdtree', 'balltree']:
+		return TreeIndex(method)
+	elif method == 'ivf':
+		return IVFIndex(n_lists=ivf_lists, n_probes=ivf_probes)
+	else:
+		raise Exception('Unknown index method ' + method)
+
+def save_index(index, version, size):
+	with open(index_pickle, 'wb') as handle:
+		pickle.dump({ 'method': index_method, 'version': version, 'size': size, 'index': index }, handle)
+
+def load_index(version, size):
+	try:
+		with open(index_pickle, 'rb') as handle:
+			stored = pickle.load(handle)
+	except FileNotFoundError:
+		return None
+	if stored['method'] != index_method or stored['version'] != version or stored['size'] != size:
+		return None
+	return stored['index']
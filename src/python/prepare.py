@@ -1,13 +1,22 @@
 import os
+import sys
 import pickle
-from PIL import Image
+import time
+import numpy as np
 
-from settings import scaler_pickle, pca_pickle, token_file, pca_size
-from database import text_collection, classify_collection
-from graphics import image_to_ratio, image_to_grid, vector_to_embedding
+from settings import scaler_pickle, pca_pickle, model_npz, token_file, pca_size, \
+	drift_threshold, refit_fraction, refit_batch_size, store_batch_size, n_prototypes, prototype_sample_size, \
+	glyph_file, cascade, rerank_grid_size, rerank_feature_cache, sign_prefilter, sign_prototype
+from database import db, text_collection, classify_collection
+from references import References, store_version, coordinates
+from features import FeatureCache, file_features, file_stamp, unpack_grid
+from graphics import export_projection
+from codec import encode_grid, encode_pca, decode_pca
 
 from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
+
+staging_name = 'classify_staging'
 
 def token_list():
 	tokens = []
@@ -28,15 +37,13 @@ def token_list():
 						'glyph': glyph_index})
 	return tokens
 
-def token_image(token):
-	return Image.open(token_file(token))
-
 def add_grids(tokens):
-	for token in tokens:
-		image = token_image(token)
-		token['ratio'] = image_to_ratio(image)
-		token['grid'] = image_to_grid(image)
+	features = file_features([token_file(token) for token in tokens])
+	for token, (ratio, packed) in zip(tokens, features):
+		token['ratio'] = ratio
+		token['grid'] = unpack_grid(packed)
 		token['vector'] = token['grid'].flatten()
+		token['stamp'] = list(file_stamp(token_file(token)))
 
 def train_pca(tokens):
 	vectors = [token['vector'] for token in tokens]
@@ -47,39 +54,183 @@ def train_pca(tokens):
 	pca.fit(scaleds)
 	return scaler, pca
 
-def store_pca(scaler, pca):
+def train_incremental_pca(tokens):
+	scaler = StandardScaler()
+	for start in range(0, len(tokens), refit_batch_size):
+		scaler.partial_fit([token['vector'] for token in tokens[start:start+refit_batch_size]])
+	pca = IncrementalPCA(n_components=pca_size)
+	start = 0
+	while start < len(tokens):
+		end = start + refit_batch_size
+		# every batch passed to partial_fit needs at least pca_size vectors
+		if len(tokens) - end < pca_size:
+			end = len(tokens)
+		pca.partial_fit(scaler.transform([token['vector'] for token in tokens[start:end]]))
+		start = end
+	return scaler, pca
+
+def store_pca(scaler, pca, version):
 	with open(scaler_pickle, 'wb') as handle:
 		pickle.dump(scaler, handle)
 	with open(pca_pickle, 'wb') as handle:
 		pickle.dump(pca, handle)
+	export_projection(model_npz, scaler, pca, version)
 
 def add_pca(tokens, scaler, pca):
-	for token in tokens:
-		token['pca'] = vector_to_embedding(token['vector'].tolist(), scaler, pca)
+	if len(tokens) == 0:
+		return
+	embeddings = pca.transform(scaler.transform([token['vector'] for token in tokens]))
+	for token, embedding in zip(tokens, embeddings):
+		token['pca'] = embedding
 
-def store_properties(sign, text, page, line, glyph, ratio, grid, pca):
-	classify_collection.delete_many({ 'text': text, 'page': page, 'line': line, 'glyph': glyph })
-	classify_collection.insert_one({ 'sign': sign, 
-			'text': text, 'page': page, 'line': line, 'glyph': glyph,
-			'ratio': ratio, 'grid': grid, 'pca': pca })
+def token_document(token):
+	return { 'sign': token['sign'], 
+			'text': token['text'], 'page': token['page'], 'line': token['line'], 'glyph': token['glyph'],
+			'ratio': token['ratio'], 'grid': encode_grid(token['grid']), 'pca': encode_pca(token['pca']),
+			'stamp': token['stamp'] }
 
+# Tokens are written in batches to a staging collection, which then replaces
+# the classify collection in one rename, so classification never sees a
+# partial collection.
 def store_all(tokens):
-	classify_collection.drop()
-	for token in tokens:
-		store_properties(token['sign'], 
-			token['text'], token['page'], token['line'], token['glyph'], 
-			token['ratio'], token['grid'].tolist(), token['pca'].tolist())
+	start = time.time()
+	staging = db[staging_name]
+	staging.drop()
+	staging.create_index([(c, 1) for c in coordinates], unique=True)
+	staging.create_index('sign')
+	for batch_start in range(0, len(tokens), store_batch_size):
+		batch = tokens[batch_start:batch_start+store_batch_size]
+		staging.insert_many([token_document(token) for token in batch], ordered=False)
+	staging.rename(classify_collection.name, dropTarget=True)
+	end = time.time()
+	print('Storing {} glyphs took {:0.1f} sec ({:0.0f} glyphs/sec)'.format(\
+		len(tokens), end-start, len(tokens) / max(end-start, 1e-6)))
+
+# Rows of up to n_prototypes tokens per sign, by k-medoids, grouped by sign as
+# in refs.sign_order. Frequent signs are clustered on a sample. Without a
+# working scikit-learn-extra, there are none, and centroids are used instead.
+def prototype_rows(refs):
+	try:
+		from sklearn_extra.cluster import KMedoids
+	except (ImportError, ValueError) as e:
+		print('Warning: no k-medoids prototypes, using centroids:', e, file=sys.stderr)
+		return None
+	rng = np.random.default_rng(0)
+	rows = []
+	for start, end in zip(refs.sign_starts, np.r_[refs.sign_starts[1:], len(refs)]):
+		group = refs.sign_order[start:end]
+		if len(group) > prototype_sample_size:
+			group = np.sort(rng.choice(group, prototype_sample_size, replace=False))
+		if len(group) <= n_prototypes:
+			rows.extend(group)
+		else:
+			kmedoids = KMedoids(n_clusters=n_prototypes, init='k-medoids++', random_state=0)
+			kmedoids.fit(refs.matrix[group])
+			rows.extend(group[np.sort(kmedoids.medoid_indices_)])
+	return np.array(rows, dtype=np.int64)
+
+def rerank_grids(refs):
+	files = [glyph_file(*c) for c in refs.coords]
+	features = file_features(files, cache=FeatureCache(rerank_feature_cache, rerank_grid_size))
+	return np.array([packed for _, packed in features], dtype=np.uint8)
+
+def store_index(version):
+	refs = References(version=version)
+	refs.save_index()
+	refs.save_snapshot()
+	if sign_prefilter is not None and sign_prototype == 'kmedoids':
+		rows = prototype_rows(refs)
+		if rows is not None:
+			refs.save_prototypes(rows)
+	if cascade:
+		refs.save_rerank_grids(rerank_grids(refs))
+
+# A new version is published by replacing the classify collection, then
+# writing the model and the index, snapshot and other arrays of the
+# references, all tagged with the version, and last storing the version
+# itself. Servers load a version only once it is stored, and do not pair a
+# model with references of another version.
+def publish(tokens, scaler, pca):
+	version = time.time()
+	store_all(tokens)
+	store_pca(scaler, pca, version)
+	store_index(version)
+	store_version(version)
 
 def do_pca(tokens):
 	add_grids(tokens)
 	scaler, pca = train_pca(tokens)
-	store_pca(scaler, pca)
 	add_pca(tokens, scaler, pca)
-	store_all(tokens)
+	publish(tokens, scaler, pca)
+
+def token_key(token):
+	return tuple(token[c] for c in coordinates)
+
+def stored_tokens():
+	return { token_key(old): old for old in classify_collection.find({}, { 'grid': 0, '_id': 0 }) }
+
+def load_pca():
+	try:
+		with open(scaler_pickle, 'rb') as handle:
+			scaler = pickle.load(handle)
+		with open(pca_pickle, 'rb') as handle:
+			pca = pickle.load(handle)
+	except FileNotFoundError:
+		return None, None
+	return scaler, pca
+
+def reconstruction_error(tokens, scaler, pca):
+	scaleds = scaler.transform([token['vector'] for token in tokens])
+	restored = pca.inverse_transform(pca.transform(scaleds))
+	return np.mean(np.sum((scaleds - restored) ** 2, axis=1))
+
+# The model has drifted if it reconstructs the new glyphs markedly worse than
+# the glyphs it was trained on.
+def has_drifted(changed, unchanged, scaler, pca):
+	if len(changed) == 0:
+		return False
+	if len(unchanged) == 0 or len(changed) > refit_fraction * (len(changed) + len(unchanged)):
+		return True
+	error_changed = reconstruction_error(changed, scaler, pca)
+	error_unchanged = reconstruction_error(unchanged, scaler, pca)
+	return error_changed > drift_threshold * error_unchanged
+
+# Only added or changed glyphs are embedded, unless the model has drifted,
+# in which case scaler and PCA are refitted in batches and all glyphs embedded.
+def do_incremental(tokens):
+	scaler, pca = load_pca()
+	if scaler is None:
+		do_pca(tokens)
+		return
+	add_grids(tokens)
+	olds = stored_tokens()
+	changed = []
+	unchanged = []
+	for token in tokens:
+		old = olds.get(token_key(token))
+		if old is not None and old['sign'] == token['sign'] and old.get('stamp') == token['stamp']:
+			token['pca'] = decode_pca(old['pca'])
+			unchanged.append(token)
+		else:
+			changed.append(token)
+	if has_drifted(changed, unchanged, scaler, pca):
+		print('Refitting model on', len(tokens), 'glyphs')
+		scaler, pca = train_incremental_pca(tokens)
+		add_pca(tokens, scaler, pca)
+	else:
+		print('Embedding', len(changed), 'added or changed glyphs')
+		add_pca(changed, scaler, pca)
+	publish(tokens, scaler, pca)
 
 def main():
+	start = time.time()
 	tokens = token_list()
-	do_pca(tokens)
+	if '--incremental' in sys.argv[1:]:
+		do_incremental(tokens)
+	else:
+		do_pca(tokens)
+	end = time.time()
+	print('Training took {:0.1f} sec'.format(end-start))
 
 if __name__ == '__main__':
 	main()
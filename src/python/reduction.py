@@ -1,16 +1,28 @@
+import os
 import numpy
 import sys
 import json
-import uuid
-from PIL import Image
+import time
+import struct
 from sklearn.decomposition import PCA
 from sklearn.manifold import TSNE, MDS, Isomap, SpectralEmbedding, LocallyLinearEmbedding
 from warnings import simplefilter
 
-from settings import path_file
-from graphics import add_background
+from settings import path_file, reduction_cache_dir, reduction_cache_size, reduction_feature_cache, \
+	projection_cache_dir, projection_cache_size, reduction_budget, reduction_probe_size, reduction_complexity, \
+	reduction_probe_factor, n_landmarks
+from features import FeatureCache, file_features, extract_all
+from resultcache import ResultCache
+from nearest import squared_norms
 
 grid_size = 30
+stored_query_size = 5000
+placement_block_size = 1000
+placement_neighbours = 5
+projection_methods = ['PCA', 'Isomap', 'UMAP', 'LocallyLinearEmbedding', 'LandmarkMDS', 'LandmarkIsomap']
+landmark_methods = { 'MDS': 'LandmarkMDS', 'Isomap': 'LandmarkIsomap' }
+# Part of the keys of cached reductions, raised when their values change
+cache_format = 2
 
 simplefilter(action='ignore', category=FutureWarning)
 
@@ -27,80 +39,255 @@ def get_reduction(method, dimension):
 		return SpectralEmbedding(n_components=dimension)
 	elif method == 'LocallyLinearEmbedding':
 		return LocallyLinearEmbedding(n_components=dimension)
+	elif method == 'LandmarkMDS':
+		from landmarks import LandmarkMDS
+		return LandmarkMDS(n_components=dimension, n_landmarks=n_landmarks)
+	elif method == 'LandmarkIsomap':
+		from landmarks import LandmarkIsomap
+		return LandmarkIsomap(n_components=dimension, n_landmarks=n_landmarks)
 	elif method == 'UMAP':
 		from umap import UMAP
 		return UMAP(n_components=dimension, init='random', random_state=0)
 	else:
 		raise Exception('Unknown method ' + method)
 
-def image_to_vector(image):
-	image = add_background(image)
-	resized = image.resize((grid_size, grid_size))
-	bilevel = resized.convert('1')
-	grid = numpy.asarray(bilevel)
-	return [x for xs in grid for x in xs]
+def packed_to_matrix(features, size, dtype=numpy.uint8):
+	matrix = numpy.empty((len(features), size * size), dtype=dtype)
+	for i, (_, packed) in enumerate(features):
+		matrix[i] = numpy.unpackbits(packed, count=size*size)
+	return matrix
 
-def path_to_image_vector(path):
-	try:
-		image = Image.open(path_file(path))
-	except FileNotFoundError:
-		return None
+def paths_to_vectors(paths):
+	found = [path for path in paths if os.path.exists(path_file(path))]
+	cache = FeatureCache(reduction_feature_cache, grid_size)
+	features = file_features([path_file(path) for path in found], cache=cache)
+	return found, packed_to_matrix(features, grid_size)
+
+# Vectors from the grids (25x25) or embeddings (PCA) stored by prepare.py in
+# the classify collection. Tokens not stored there are decoded from images.
+def paths_to_stored_vectors(paths, feature):
+	from settings import grid_size as stored_grid_size, pca_size
+	from database import classify_collection
+	from references import coordinates
+	from codec import decode_grid, decode_pca
+	decode = decode_grid if feature == 'grid' else decode_pca
+	width = stored_grid_size * stored_grid_size if feature == 'grid' else pca_size
+	matrix = numpy.empty((len(paths), width), dtype=numpy.float32)
+	row = { tuple(path): i for i, path in enumerate(paths) }
+	filled = numpy.zeros(len(paths), dtype=bool)
+	for start in range(0, len(paths), stored_query_size):
+		clauses = [dict(zip(coordinates, path)) for path in paths[start:start+stored_query_size]]
+		projection = { c: 1 for c in coordinates + [feature] }
+		projection['_id'] = 0
+		for old in classify_collection.find({ '$or': clauses }, projection):
+			i = row[tuple(old[c] for c in coordinates)]
+			matrix[i] = decode(old[feature]).ravel()
+			filled[i] = True
+	missing = [i for i in range(len(paths)) if not filled[i] and os.path.exists(path_file(paths[i]))]
+	if len(missing) > 0:
+		features = extract_all([path_file(paths[i]) for i in missing])
+		grids = packed_to_matrix(features, stored_grid_size)
+		if feature == 'pca':
+			from classification import get_pca
+			matrix[missing] = get_pca().transform(grids)
+		else:
+			matrix[missing] = grids
+		filled[missing] = True
+	return [path for path, f in zip(paths, filled) if f], matrix[filled]
+
+def paths_to_source_vectors(paths, source):
+	if source == 'grids':
+		return paths_to_stored_vectors(paths, 'grid')
+	elif source == 'embeddings':
+		return paths_to_stored_vectors(paths, 'pca')
+	else:
+		return paths_to_vectors(paths)
+
+def no_progress(text):
+	pass
+
+# Tokens not in the fitted sample get the average embedding of their nearest
+# sampled tokens, weighted by inverse distance.
+def place_by_neighbours(vecs, sample, sample_embeds):
+	sample = sample.astype(numpy.float32)
+	norms = squared_norms(sample)
+	k = min(placement_neighbours, len(sample))
+	placed = numpy.empty((len(vecs), sample_embeds.shape[1]), dtype=numpy.float32)
+	for start in range(0, len(vecs), placement_block_size):
+		block = vecs[start:start+placement_block_size].astype(numpy.float32)
+		dists = numpy.maximum(norms - 2 * (block @ sample.T) + squared_norms(block)[:, None], 0)
+		nearest = numpy.argpartition(dists, k-1, axis=1)[:, :k]
+		weights = 1 / (numpy.sqrt(numpy.take_along_axis(dists, nearest, axis=1)) + 1e-6)
+		placed[start:start+len(block)] = (weights[:, :, None] * sample_embeds[nearest]).sum(axis=1) / \
+			weights.sum(axis=1, keepdims=True)
+	return placed
+
+# Seconds per token to the power of the exponent of the method, from fits on
+# half and all of the probe size; the smaller of two fits on half, before and
+# after the larger one, leaves out the warm-up of the first fit in the process.
+def probe_rate(vecs, method, dimension, exponent):
+	sizes = [reduction_probe_size // 2, reduction_probe_size, reduction_probe_size // 2]
+	times = []
+	for size in sizes:
+		red = get_reduction(method, dimension)
+		start = time.time()
+		red.fit_transform(vecs[:size])
+		times.append(time.time() - start)
+	return (times[1] - min(times[0], times[2])) / (sizes[1] ** exponent - sizes[0] ** exponent)
+
+# Fits within reduction_budget seconds, on a random sample if needed; MDS and
+# Isomap are replaced by their landmark variants instead. Returns the fitted
+# reducer, the embeddings of all vectors, the size of the sample and the
+# method used.
+def fit_reduction(vecs, method, dimension, progress=no_progress):
+	n = len(vecs)
+	order = numpy.random.default_rng(0).permutation(n)
+	n_fit = n
+	if n > reduction_probe_factor * reduction_probe_size:
+		progress('Estimating time of {} on {} tokens'.format(method, n))
+		exponent = reduction_complexity.get(method, 2)
+		rate = probe_rate(vecs[order[:reduction_probe_size]], method, dimension, exponent)
+		if rate > 0:
+			n_fit = min(n, max(int((reduction_budget / rate) ** (1 / exponent)), reduction_probe_size))
+		if n_fit < n and method in landmark_methods:
+			method = landmark_methods[method]
+			n_fit = n
+	progress('Fitting {} on {} of {} tokens'.format(method, n_fit, n))
+	fitted = numpy.sort(order[:n_fit])
+	red = get_reduction(method, dimension)
+	embeds = numpy.empty((n, dimension), dtype=numpy.float32)
+	embeds[fitted] = red.fit_transform(vecs[fitted])
+	if n_fit < n:
+		rest = numpy.sort(order[n_fit:])
+		progress('Placing {} other tokens'.format(len(rest)))
+		if method in projection_methods:
+			embeds[rest] = red.transform(vecs[rest])
+		else:
+			embeds[rest] = place_by_neighbours(vecs[rest], vecs[fitted], embeds[fitted])
+	return red, embeds, n_fit, method
+
+# Embeddings are cached by method, dimension, source, grid size and the set of
+# token paths, so a repeated analysis does not decode images or fit again.
+def reduce_paths(paths, method, dimension, source='images', progress=no_progress):
+	from references import stored_version
+	key = [cache_format, method, dimension, source, grid_size, reduction_budget, paths]
+	if source != 'images':
+		key.append(stored_version())
+	cache = ResultCache(reduction_cache_dir, reduction_cache_size)
+	cached = cache.get(key)
+	if cached is None:
+		progress('Reading {} tokens'.format(len(paths)))
+		found, vecs = paths_to_source_vectors(paths, source)
+		_, embeds, n_fit, used = fit_reduction(vecs, method, dimension, progress)
+		cached = (found, embeds, n_fit, used)
+		cache.put(key, cached)
+	return cached
+
+def corpus_paths(signs):
+	from database import text_collection
+	paths = []
+	for text in text_collection.find({}, { 'index': 1, 'pages': 1 }):
+		for page in text['pages']:
+			for line in page['lines']:
+				for glyph in line['glyphs']:
+					if glyph['name'] in signs:
+						paths.append([text['index'], page['index'], line['index'], glyph['index']])
+	return sorted(paths)
+
+# A reducer fitted once on all tokens of a group of signs in the corpus, and
+# persisted, so that later queries only need to transform their tokens and
+# plots of different selections share one embedding. It is refitted after
+# prepare.py has been run.
+def get_projection(signs, method, dimension, source='images', progress=no_progress):
+	from references import stored_version
+	if method not in projection_methods:
+		raise ValueError('Method ' + method + ' cannot project new tokens')
+	signs = sorted(set(signs))
+	key = [cache_format, method, dimension, source, grid_size, reduction_budget, signs, stored_version()]
+	cache = ResultCache(projection_cache_dir, projection_cache_size)
+	projection = cache.get(key)
+	if projection is None:
+		paths = corpus_paths(set(signs))
+		progress('Reading {} tokens of corpus'.format(len(paths)))
+		_, vecs = paths_to_source_vectors(paths, source)
+		red, embeds, n_fit, used = fit_reduction(vecs, method, dimension, progress)
+		projection = { 'reduction': red, 'low': embeds.min(axis=0), 'high': embeds.max(axis=0),
+			'n_fit': n_fit, 'n': len(vecs), 'method': used }
+		cache.put(key, projection)
+	return projection
+
+# Returns the tokens found, their embeddings, bounds for normalization (None
+# for those of the embeddings themselves), and the number of tokens the
+# reduction was fitted on, the number it was meant for and the method used.
+def get_embeddings(tokens, method, dimension, source='images', signs=None, progress=no_progress):
+	paths = [list(path) for path in sorted({ tuple(token['path']) for token in tokens })]
+	bounds = None
+	if signs is None:
+		found, embeds, n_fit, used = reduce_paths(paths, method, dimension, source, progress)
+		fitted = (n_fit, len(found), used)
 	else:
-		return image_to_vector(image)
-
-def get_embeddings(tokens, red):
-	vecs = []
-	tokens_ext = []
-	for token in tokens:
-		vec = path_to_image_vector(token['path'])
-		if vec:
-			vecs.append(vec)
-			tokens_ext.append(token)
-	embeds = red.fit_transform(vecs)
-	for i in range(len(vecs)):
-		tokens_ext[i]['embedding'] = embeds[i].tolist()
-	return tokens_ext
-
-def normalize_embeddings(embeddings, dimension):
+		projection = get_projection(signs, method, dimension, source, progress)
+		found, vecs = paths_to_source_vectors(paths, source)
+		embeds = numpy.asarray(projection['reduction'].transform(vecs), dtype=numpy.float32)
+		bounds = (projection['low'], projection['high'])
+		fitted = (projection['n_fit'], projection['n'], projection['method'])
+	row = { tuple(path): i for i, path in enumerate(found) }
+	tokens_ext = [token for token in tokens if tuple(token['path']) in row]
+	rows = [row[tuple(token['path'])] for token in tokens_ext]
+	return tokens_ext, embeds[rows], bounds, fitted
+
+def normalize_embeddings(embeds, bounds=None):
 	margin = 0.25
-	if len(embeddings) == 0:
-		return embeddings
-	scales = []
-	mids = []
-	for i in range(dimension):
-		ems = [em['embedding'][i] for em in embeddings]
-		high = max(ems)
-		low = min(ems)
-		diff = high-low
-		mid = low + diff / 2
-		scale = diff * (1 + margin) / 2
-		scales.append(scale if scale > 0 else 1)
-		mids.append(mid)
-	for em in embeddings:
-		vec = em['embedding']
-		em['embedding'] = [(vec[i] - mids[i]) / scales[i] for i in range(len(vec))]
-	return embeddings
+	if len(embeds) == 0:
+		return embeds
+	if bounds is None:
+		low, high = embeds.min(axis=0), embeds.max(axis=0)
+	else:
+		low, high = bounds
+	diff = high - low
+	mid = low + diff / 2
+	scale = diff * (1 + margin) / 2
+	scale[scale <= 0] = 1
+	return (embeds - mid) / scale
+
+# Protocol with routes/signs.js. The request on stdin is a JSON object with
+# method, dimension, source, signs (null unless projecting onto the corpus)
+# and paths of tokens. Each message on stdout is a frame: a uint32
+# (little-endian) length, a JSON header of that length, and as many raw bytes
+# as the header's 'bytes'. Headers are progress, error, note, or result: the
+# indexes in paths of tokens found, followed by their normalized embeddings as
+# float32, one row per token.
+def report(data=b'', **header):
+	header['bytes'] = len(data)
+	encoded = json.dumps(header).encode('utf-8')
+	sys.stdout.buffer.write(struct.pack('<I', len(encoded)) + encoded + data)
+	sys.stdout.buffer.flush()
+
+def report_progress(text):
+	report(progress=text)
 
 def main():
-	method = sys.argv[1]
-	dimension = int(sys.argv[2])
-	tokensFile = sys.argv[3]
-	with open(tokensFile, 'r') as handle:
-		tokens = json.load(handle)
+	request = json.load(sys.stdin)
+	method = request['method']
+	dimension = int(request['dimension'])
+	source = request.get('source') or 'images'
+	signs = request.get('signs')
+	tokens = [{ 'path': path, 'index': i } for i, path in enumerate(request['paths'])]
 	if len(tokens) <= dimension:
-		sys.stderr.write('Too few tokens')
+		report(error='Too few tokens')
 		return
-	red = get_reduction(method, dimension)
 	try:
-		embeddings = get_embeddings(tokens, red)
-		normalize_embeddings(embeddings, dimension)
-		filename = './python/tmp/' + str(uuid.uuid4()) + '.json'
-		with open(filename, 'w') as f:
-			json.dump(embeddings, f)
+		embeddings, embeds, bounds, (n_fit, n, used) = \
+			get_embeddings(tokens, method, dimension, source, signs, report_progress)
 	except ValueError as err:
-		sys.stderr.write(str(err))
+		report(error=str(err))
 	else:
-		sys.stdout.write(filename)
+		if used != method:
+			report(note='{} was replaced by {} on {} tokens'.format(method, used, n))
+		elif n_fit < n:
+			report(note='{} was fitted on a sample of {} of {} tokens'.format(method, n_fit, n))
+		data = numpy.ascontiguousarray(normalize_embeddings(embeds, bounds), dtype='<f4').tobytes()
+		report(data, result=[token['index'] for token in embeddings], dimension=dimension)
 
 if __name__ == '__main__':
 	main()
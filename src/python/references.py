@@ -0,0 +1,220 @@
+import numpy as np
+
+from settings import pca_size, version_file, prototypes_file, rerank_file, rerank_grid_size, \
+	sign_prefilter, sign_prototype
+from database import classify_collection
+from codec import decode_pcas
+from nearest import make_index, load_index, save_index, squared_norms, top_k
+from snapshot import read_snapshot, write_snapshot
+
+coordinates = ['text', 'page', 'line', 'glyph']
+
+def stored_version():
+	try:
+		with open(version_file, 'r') as handle:
+			return handle.read().strip()
+	except FileNotFoundError:
+		return None
+
+def store_version(version):
+	with open(version_file, 'w') as handle:
+		handle.write(str(version))
+
+# Arrays derived from the references, valid for one version and size.
+def save_arrays(file, version, size, **arrays):
+	np.savez(file, version=str(version), size=size, **arrays)
+
+def load_arrays(file, version, size):
+	try:
+		with np.load(file) as stored:
+			if str(stored['version']) == str(version) and int(stored['size']) == size:
+				return { name: stored[name] for name in stored.files }
+	except FileNotFoundError:
+		pass
+	return None
+
+# All reference embeddings in one float32 matrix, with labels and coordinates
+# in parallel arrays. For searches by sign, sign_order lists the rows grouped
+# by sign, the group of the i-th sign in sign_names starting at sign_starts[i].
+# Without arrays (signs, coordinates, matrix), these are loaded from the
+# snapshot or the classify collection, for the stored version unless another
+# is given.
+class References:
+	def __init__(self, arrays=None, version=None):
+		if arrays is None:
+			self.load(version)
+		else:
+			self.version = None
+			self.signs, self.coords, self.matrix = arrays
+			self.attach()
+
+	def load(self, version=None):
+		self.version = str(version) if version is not None else stored_version()
+		snapshot = read_snapshot(self.version)
+		if snapshot is not None:
+			self.signs, self.coords, self.matrix = snapshot
+		else:
+			self.load_database()
+		self.attach()
+		self.load_prototypes()
+		self.load_rerank_grids()
+
+	def attach(self):
+		self.norms = squared_norms(self.matrix)
+		self.group_signs()
+		self.prototype_rows = None
+		self.rerank_grids = None
+		self.index = load_index(self.version, len(self.signs)) if self.version is not None else None
+		if self.index is None:
+			self.index = make_index()
+			self.index.build(self.matrix)
+		else:
+			self.index.attach(self.matrix)
+
+	def load_database(self):
+		olds = list(classify_collection.find({}, { 'grid': 0, '_id': 0 }).sort([(c, 1) for c in coordinates]))
+		self.signs = np.array([old['sign'] for old in olds], dtype=object)
+		self.coords = np.array([[old[c] for c in coordinates] for old in olds], dtype=np.int32).reshape(-1, 4)
+		self.matrix = np.ascontiguousarray(decode_pcas([old['pca'] for old in olds], pca_size))
+
+	def group_signs(self):
+		self.sign_order = np.argsort(self.signs, kind='stable')
+		grouped = self.signs[self.sign_order]
+		self.sign_starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]]) if len(grouped) > 0 \
+			else np.empty(0, dtype=np.intp)
+		self.sign_names = grouped[self.sign_starts]
+		self.prototypes = {}
+
+	# Prototypes of signs, as matrix, squared norms, and the index of the first
+	# prototype of each sign: the 'centroid' of its tokens, the 'medoid', here
+	# the token nearest to the centroid, or 'kmedoids', the tokens chosen by
+	# prepare.py, if stored for the current version.
+	def sign_prototypes(self, kind=sign_prototype):
+		if kind == 'kmedoids' and self.prototype_rows is None:
+			kind = 'centroid'
+		if kind not in self.prototypes:
+			if kind == 'kmedoids':
+				rows = self.prototype_rows
+				labels = self.signs[rows]
+				starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+				prototypes = self.matrix[rows]
+			else:
+				grouped = self.matrix[self.sign_order]
+				counts = np.diff(np.r_[self.sign_starts, len(grouped)])
+				centroids = np.add.reduceat(grouped, self.sign_starts, axis=0) / counts[:, None]
+				if kind == 'medoid':
+					dists = squared_norms(grouped - np.repeat(centroids, counts, axis=0))
+					starts = self.sign_starts
+					prototypes = grouped[[starts[i] + np.argmin(dists[starts[i]:starts[i]+counts[i]]) \
+						for i in range(len(starts))]]
+				else:
+					prototypes = centroids
+				starts = np.arange(len(self.sign_names))
+			prototypes = np.ascontiguousarray(prototypes, dtype=np.float32)
+			self.prototypes[kind] = (prototypes, squared_norms(prototypes), starts)
+		return self.prototypes[kind]
+
+	# Rows of the prototypes, grouped by sign in the order of sign_names.
+	def save_prototypes(self, rows):
+		save_arrays(prototypes_file, self.version, len(self), rows=rows)
+
+	def load_prototypes(self):
+		stored = load_arrays(prototypes_file, self.version, len(self))
+		if stored is not None:
+			self.prototype_rows = stored['rows']
+
+	# Bit-packed grids of rerank_grid_size for the second stage of the cascade.
+	def save_rerank_grids(self, packed):
+		save_arrays(rerank_file, self.version, len(self), grids=packed, grid_size=rerank_grid_size)
+
+	def load_rerank_grids(self):
+		stored = load_arrays(rerank_file, self.version, len(self))
+		if stored is not None and int(stored['grid_size']) == rerank_grid_size:
+			self.rerank_grids = stored['grids']
+
+	def rerank_grids_of(self, rows):
+		size = rerank_grid_size
+		return np.unpackbits(self.rerank_grids[rows], axis=1, count=size*size).reshape(-1, size, size)
+
+	def save_index(self):
+		save_index(self.index, self.version, len(self.signs))
+
+	def save_snapshot(self):
+		write_snapshot(self.version, self.signs, self.coords, self.matrix)
+
+	def is_stale(self):
+		return stored_version() != self.version
+
+	def refresh(self):
+		if self.is_stale():
+			self.load()
+			return True
+		return False
+
+	def __len__(self):
+		return len(self.signs)
+
+	def distances(self, pca):
+		query = np.asarray(pca, dtype=np.float32)
+		dists = self.norms - 2 * (self.matrix @ query) + query @ query
+		return np.maximum(dists, 0)
+
+	def batch_distances(self, pcas, max_block=1 << 22):
+		queries = np.asarray(pcas, dtype=np.float32)
+		step = max(1, max_block // max(1, len(self)))
+		for start in range(0, len(queries), step):
+			block = queries[start:start+step]
+			dists = self.norms[None, :] - 2 * (block @ self.matrix.T) + squared_norms(block)[:, None]
+			yield from np.maximum(dists, 0)
+
+	def nearest(self, pca, k):
+		if k >= len(self):
+			return top_k(self.distances(pca), k)
+		best, _ = self.index.query(pca, k)
+		return best
+
+	# Rows of the nearest tokens of the k nearest distinct signs, nearest first,
+	# from the distances to rows in sign_order, taking the minimum per sign.
+	def nearest_signs_in(self, dists, k, rows=None, starts=None):
+		rows = rows if rows is not None else self.sign_order
+		starts = starts if starts is not None else self.sign_starts
+		if len(rows) == 0:
+			return np.empty(0, dtype=np.intp)
+		sign_dists = np.minimum.reduceat(dists, starts)
+		ends = np.r_[starts[1:], len(rows)]
+		best = [starts[i] + np.argmin(dists[starts[i]:ends[i]]) for i in top_k(sign_dists, k)]
+		return rows[best]
+
+	# With a prefilter, only tokens of that many signs with the nearest
+	# prototypes are compared.
+	def nearest_signs(self, pca, k, prefilter=sign_prefilter, prototype=sign_prototype):
+		query = np.asarray(pca, dtype=np.float32)
+		if prefilter is None or max(k, prefilter) >= len(self.sign_names):
+			return self.nearest_signs_in(self.distances(query)[self.sign_order], k)
+		prototypes, proto_norms, proto_starts = self.sign_prototypes(prototype)
+		proto_dists = np.minimum.reduceat(proto_norms - 2 * (prototypes @ query), proto_starts)
+		groups = np.sort(top_k(proto_dists, max(k, prefilter)))
+		lengths = np.diff(np.r_[self.sign_starts, len(self)])[groups]
+		rows = np.concatenate([self.sign_order[s:s+n] for s, n in zip(self.sign_starts[groups], lengths)])
+		dists = np.maximum(self.norms[rows] - 2 * (self.matrix[rows] @ query) + query @ query, 0)
+		return self.nearest_signs_in(dists, k, rows, np.r_[0, np.cumsum(lengths)[:-1]])
+
+	def candidate(self, i):
+		candidate = { c: int(v) for c, v in zip(coordinates, self.coords[i]) }
+		candidate['sign'] = self.signs[i]
+		candidate['pca'] = self.matrix[i]
+		return candidate
+
+	def candidates(self, indexes):
+		for i in indexes:
+			yield self.candidate(i)
+
+references = None
+
+def get_references():
+	global references
+	if references is None:
+		references = References()
+	else:
+		references.refresh()
+	return references
@@ -0,0 +1,54 @@
+import os
+import pickle
+import hashlib
+import json
+
+# Results of expensive computations, pickled in a directory, one file per key.
+# When the files together exceed max_bytes, the least recently used ones are
+# removed.
+
+class ResultCache:
+	def __init__(self, directory, max_bytes):
+		self.directory = directory
+		self.max_bytes = max_bytes
+
+	def file(self, key):
+		digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+		return os.path.join(self.directory, digest + '.pickle')
+
+	def get(self, key):
+		file = self.file(key)
+		try:
+			with open(file, 'rb') as handle:
+				stored = pickle.load(handle)
+		except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+			return None
+		if stored['key'] != key:
+			return None
+		os.utime(file)
+		return stored['value']
+
+	def put(self, key, value):
+		os.makedirs(self.directory, exist_ok=True)
+		file = self.file(key)
+		tmp_file = file + '.tmp'
+		with open(tmp_file, 'wb') as handle:
+			pickle.dump({ 'key': key, 'value': value }, handle)
+		os.replace(tmp_file, file)
+		self.evict()
+
+	def evict(self):
+		entries = []
+		for name in os.listdir(self.directory):
+			if name.endswith('.pickle'):
+				stat = os.stat(os.path.join(self.directory, name))
+				entries.append((stat.st_mtime, stat.st_size, name))
+		total = sum([size for _, size, _ in entries])
+		for _, size, name in sorted(entries):
+			if total <= self.max_bytes:
+				break
+			try:
+				os.remove(os.path.join(self.directory, name))
+			except FileNotFoundError:
+				pass
+			total -= size
@@ -0,0 +1,107 @@
+import sys
+import json
+from PIL import Image
+
+from settings import glyph_file
+from classification import get_pca, classify, classify_distribution, classify_batch, line_coordinates
+from references import References
+import guess
+
+# Long-lived classifier. Reads one JSON request per line on stdin and writes
+# one JSON response per line on stdout, e.g.
+#   {"id": 1, "op": "classify", "text": 3, "page": 1, "line": 2, "glyph": 5}
+#   {"id": 1, "result": "A1"}
+# Model and reference tokens are loaded once, and again when prepare.py has
+# stored a new version, or on op "reload".
+
+class Classifier:
+	def __init__(self):
+		self.refs = None
+		self.error = None
+		self.load()
+
+	# A model that cannot be loaded, e.g. before the first training, is
+	# reported in the response to every request, and loading is tried again
+	# on the next one.
+	def load(self):
+		try:
+			self.model = get_pca()
+			if self.refs is None:
+				self.refs = References()
+			else:
+				self.refs.load()
+			if self.model.version is not None and self.model.version != self.refs.version:
+				raise Exception('training in progress')
+			self.error = None
+		except Exception as e:
+			self.error = 'Cannot load model: ' + str(e)
+
+	def refresh(self):
+		if self.error is not None or self.refs.is_stale():
+			self.load()
+		if self.error is not None:
+			raise Exception(self.error)
+
+	def classify(self, image):
+		return classify(image, model=self.model, refs=self.refs)
+
+	def classify_distribution(self, image, k):
+		return classify_distribution(image, k, model=self.model, refs=self.refs)
+
+	def classify_batch(self, coords, k):
+		return classify_batch(coords, k, model=self.model, refs=self.refs)
+
+	def guess(self, sign):
+		return guess.classify(sign, model=self.model, refs=self.refs)
+
+def handle(classifier, request):
+	op = request['op']
+	if op == 'ping':
+		return 'pong'
+	elif op == 'reload':
+		classifier.load()
+	classifier.refresh()
+	if op == 'reload':
+		return len(classifier.refs)
+	elif op == 'classify':
+		file = glyph_file(request['text'], request['page'], request['line'], request['glyph'])
+		try:
+			image = Image.open(file)
+		except FileNotFoundError:
+			raise Exception('File not found')
+		return classifier.classify(image)
+	elif op == 'batch':
+		if 'tokens' in request:
+			coords = [tuple(token) for token in request['tokens']]
+		else:
+			coords = line_coordinates(request['text'], request['page'], request.get('line'),
+				unnamed=request.get('unnamed', False))
+		return classifier.classify_batch(coords, request.get('k', guess.n_candidates))
+	elif op == 'guess':
+		return classifier.guess(request['sign'])
+	else:
+		raise Exception('Unknown operation ' + str(op))
+
+def respond(response):
+	sys.stdout.write(json.dumps(response) + '\n')
+	sys.stdout.flush()
+
+def main():
+	classifier = Classifier()
+	respond({ 'ready': True })
+	while True:
+		line = sys.stdin.readline()
+		if not line:
+			break
+		if not line.strip():
+			continue
+		request = None
+		try:
+			request = json.loads(line)
+			response = { 'id': request.get('id'), 'result': handle(classifier, request) }
+		except Exception as e:
+			response = { 'id': request.get('id') if isinstance(request, dict) else None, 'error': str(e) }
+		respond(response)
+
+if __name__ == '__main__':
+	main()
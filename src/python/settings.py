@@ -8,6 +8,17 @@ backups_root = os.path.join(root_dir, 'backups')
 
 scaler_pickle = os.path.join(this_dir, 'scaler.pickle')
 pca_pickle = os.path.join(this_dir, 'pca.pickle')
+model_npz = os.path.join(this_dir, 'model.npz')
+version_file = os.path.join(this_dir, 'version.txt')
+index_pickle = os.path.join(this_dir, 'index.pickle')
+snapshot_file = os.path.join(this_dir, 'embeddings.snapshot')
+feature_cache = os.path.join(this_dir, 'features.pickle')
+prototypes_file = os.path.join(this_dir, 'prototypes.npz')
+rerank_file = os.path.join(this_dir, 'rerank.npz')
+rerank_feature_cache = os.path.join(this_dir, 'rerankfeatures.pickle')
+reduction_feature_cache = os.path.join(this_dir, 'reductionfeatures.pickle')
+reduction_cache_dir = os.path.join(this_dir, 'cache')
+projection_cache_dir = os.path.join(this_dir, 'projections')
 
 def glyph_file(text, page, line, glyph):
 	return os.path.join(images_root, str(text), str(page), str(line), str(glyph) + '.png')
@@ -20,3 +31,72 @@ def path_file(path):
 
 grid_size = 25
 pca_size = 50
+
+# Incremental retraining refits the model if the added or changed glyphs are
+# more than this fraction of all glyphs, or if their reconstruction error is
+# more than drift_threshold times that of the unchanged glyphs
+refit_fraction = 0.2
+drift_threshold = 1.5
+# Glyphs per batch when refitting
+refit_batch_size = 1000
+# Glyphs per batch written to the database
+store_batch_size = 1000
+# Store grids and PCA vectors in the classify collection as binary;
+# convert an existing collection with migrate.py
+compact_storage = False
+
+# Maximum bytes of cached analysis results
+reduction_cache_size = 100 * 1024 * 1024
+# Maximum bytes of reducers fitted on the whole corpus
+projection_cache_size = 500 * 1024 * 1024
+# Seconds an analysis may spend fitting a reduction. The time for all tokens is
+# extrapolated from fits on reduction_probe_size tokens and on half as many,
+# whose difference leaves out fixed costs, with the exponent of
+# reduction_complexity for the method; if over budget, the method is fitted on
+# a sample and the other tokens are placed in the embedding of the sample.
+# Selections of up to reduction_probe_factor times reduction_probe_size tokens
+# are fitted without estimating.
+reduction_budget = 30
+reduction_probe_size = 200
+reduction_probe_factor = 5
+reduction_complexity = { 'PCA': 1, 't-SNE': 1.5, 'UMAP': 1.2, 'MDS': 2, 'Isomap': 2,
+	'SpectralEmbedding': 2, 'LocallyLinearEmbedding': 2, 'LandmarkMDS': 1, 'LandmarkIsomap': 1 }
+# Landmarks of LandmarkMDS and LandmarkIsomap, which replace MDS and Isomap
+# when these would exceed the budget
+n_landmarks = 500
+
+# Processes for extracting features from glyph images, and images per batch
+n_workers = os.cpu_count() or 1
+chunk_size = 64
+
+# Nearest-neighbour index over reference embeddings:
+# 'brute' (exact), 'kdtree', 'balltree' (exact), 'ivf' (approximate)
+index_method = 'brute'
+# Number of buckets of 'ivf'; None is 4 times the square root of the number of tokens
+ivf_lists = None
+# Number of buckets of 'ivf' scanned per query
+ivf_probes = 8
+# The search for the nearest distinct signs compares only tokens of the
+# sign_prefilter signs whose prototype is nearest; None compares all tokens.
+# Prototypes are 'centroid', 'medoid', or 'kmedoids': n_prototypes per sign
+# found by prepare.py when sign_prefilter is set (else centroids), of at most
+# prototype_sample_size tokens per sign
+sign_prefilter = None
+sign_prototype = 'kmedoids'
+n_prototypes = 5
+prototype_sample_size = 1000
+# Classification in two stages: the nearest token of each of the k nearest
+# signs and the shortlist_size nearest tokens by embedding, re-ranked by image
+# distortion distance between bilevel grids of rerank_grid_size, with
+# rerank_warp and rerank_context. The grids of the references are made by
+# prepare.py, so rerun it after enabling the cascade.
+# If the shortlist takes more than shortlist_budget milliseconds, the
+# embedding ranking is kept; re-ranking stops after rerank_budget milliseconds
+# and drops the candidates it did not reach
+cascade = False
+shortlist_size = 100
+rerank_grid_size = 20
+rerank_warp = 1
+rerank_context = 1
+shortlist_budget = 10
+rerank_budget = 20
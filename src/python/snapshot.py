@@ -0,0 +1,63 @@
+import os
+import struct
+import numpy as np
+
+from settings import snapshot_file
+
+# Snapshot of the reference tokens, read with np.memmap so that processes
+# start fast and share the page cache. Layout, little-endian:
+#   header (64 bytes): magic, format, number of tokens n, dimension d,
+#       number of label bytes, model version
+#   float32 embeddings, n x d
+#   int32 coordinates (text, page, line, glyph), n x 4
+#   uint64 label offsets, n + 1
+#   UTF-8 labels
+
+magic = b'ISUTSNAP'
+snapshot_format = 1
+header_format = '<8sIIIQ32s'
+header_size = 64
+
+def write_snapshot(version, signs, coords, matrix, file=snapshot_file):
+	n, d = matrix.shape
+	labels = [str(sign).encode('utf-8') for sign in signs]
+	offsets = np.zeros(n + 1, dtype='<u8')
+	offsets[1:] = np.cumsum([len(label) for label in labels])
+	header = struct.pack(header_format, magic, snapshot_format, n, d, int(offsets[-1]),
+		str(version).encode('utf-8'))
+	tmp_file = file + '.tmp'
+	with open(tmp_file, 'wb') as handle:
+		handle.write(header.ljust(header_size, b'\0'))
+		handle.write(np.ascontiguousarray(matrix, dtype='<f4').tobytes())
+		handle.write(np.ascontiguousarray(coords, dtype='<i4').tobytes())
+		handle.write(offsets.tobytes())
+		handle.write(b''.join(labels))
+	os.replace(tmp_file, file)
+
+def read_snapshot(version, file=snapshot_file):
+	try:
+		with open(file, 'rb') as handle:
+			header = handle.read(header_size)
+	except FileNotFoundError:
+		return None
+	if len(header) < header_size:
+		return None
+	file_magic, file_format, n, d, n_label_bytes, file_version = \
+		struct.unpack(header_format, header[:struct.calcsize(header_format)])
+	if file_magic != magic or file_format != snapshot_format or \
+			file_version.rstrip(b'\0').decode('utf-8') != str(version):
+		return None
+	if n == 0:
+		return np.empty(0, dtype=object), np.empty((0, 4), dtype=np.int32), np.empty((0, d), dtype=np.float32)
+	offset = header_size
+	matrix = np.memmap(file, dtype='<f4', mode='r', offset=offset, shape=(n, d))
+	offset += 4 * n * d
+	coords = np.memmap(file, dtype='<i4', mode='r', offset=offset, shape=(n, 4))
+	offset += 4 * n * 4
+	offsets = np.memmap(file, dtype='<u8', mode='r', offset=offset, shape=(n + 1,))
+	offset += 8 * (n + 1)
+	blob = np.memmap(file, dtype=np.uint8, mode='r', offset=offset, shape=(n_label_bytes,)).tobytes() \
+		if n_label_bytes > 0 else b''
+	bounds = offsets.tolist()
+	signs = np.array([blob[bounds[i]:bounds[i+1]].decode('utf-8') for i in range(n)], dtype=object)
+	return signs, coords, matrix
@@ -3,6 +3,7 @@ const bcrypt = require('bcrypt');
 const { spawn } = require('child_process');
 
 const util = require('./util');
+const classifier = require('./classifier');
 
 const SALT = require('./salt');
 
@@ -186,7 +187,10 @@ router.get('/train', async (req, res) => {
 		util.reportNotLoggedIn(res);
 		return;
 	}
-	const process = spawn(util.python, ['./python/prepare.py']);
+	const args = ['./python/prepare.py'];
+	if (req.query && req.query.incremental)
+		args.push('--incremental');
+	const process = spawn(util.python, args);
 
 	process.stdout.on('data', (data) => {
 	});
@@ -194,7 +198,12 @@ router.get('/train', async (req, res) => {
 	process.stderr.on('data', (data) => {
 	});
 
-	process.on('close', (code) => {
+	process.on('close', async (code) => {
+		try {
+			await classifier.reload();
+		} catch (err) {
+			console.error(err.message);
+		}
 		res.redirect('../admin/users');
 	});
 		
@@ -0,0 +1,129 @@
+const { spawn } = require('child_process');
+
+const util = require('./util');
+
+/* Number of warm classification processes */
+const nWorkers = 2;
+
+/* Delays before restarting a stopped classification process, in ms */
+const firstRestartDelay = 1000;
+const maxRestartDelay = 60000;
+
+class Worker {
+	constructor() {
+		this.pending = {};
+		this.nextId = 0;
+		this.buffer = '';
+		this.process = null;
+		this.restartDelay = firstRestartDelay;
+		this.start();
+	}
+
+	start() {
+		const child = spawn(util.python, ['./python/server.py']);
+		this.process = child;
+		child.stdout.on('data', (data) => {
+			this.buffer += data.toString();
+			var newline;
+			while ((newline = this.buffer.indexOf('\n')) >= 0) {
+				const line = this.buffer.substring(0, newline);
+				this.buffer = this.buffer.substring(newline + 1);
+				if (!line.trim())
+					continue;
+				var response;
+				try {
+					response = JSON.parse(line);
+				} catch (err) {
+					console.error('Classifier: ' + line);
+					continue;
+				}
+				this.restartDelay = firstRestartDelay;
+				this.receive(response);
+			}
+		});
+		child.stderr.on('data', (data) => {
+			console.error(data.toString());
+		});
+		child.stdin.on('error', (err) => {
+			console.error('Classifier input: ' + err.message);
+		});
+		child.on('error', (err) => {
+			console.error('Classifier: ' + err.message);
+			this.stop(child);
+		});
+		child.on('close', (code) => {
+			this.stop(child);
+		});
+	}
+
+	/* Restarts after a delay that doubles while the process keeps stopping
+	without answering */
+	stop(child) {
+		if (this.process !== child)
+			return;
+		this.process = null;
+		for (const id in this.pending)
+			this.pending[id].reject(new Error('Classifier stopped'));
+		this.pending = {};
+		this.buffer = '';
+		setTimeout(() => this.start(), this.restartDelay);
+		this.restartDelay = Math.min(2 * this.restartDelay, maxRestartDelay);
+	}
+
+	alive() {
+		return this.process !== null;
+	}
+
+	receive(response) {
+		if (response.id === undefined || !(response.id in this.pending))
+			return;
+		const { resolve, reject } = this.pending[response.id];
+		delete this.pending[response.id];
+		if ('error' in response)
+			reject(new Error(response.error));
+		else
+			resolve(response.result);
+	}
+
+	load() {
+		return Object.keys(this.pending).length;
+	}
+
+	request(op, args) {
+		if (!this.alive())
+			return Promise.reject(new Error('Classifier not running'));
+		const id = this.nextId++;
+		return new Promise((resolve, reject) => {
+			this.pending[id] = { resolve, reject };
+			this.process.stdin.write(JSON.stringify({ id, op, ...args }) + '\n');
+		});
+	}
+}
+
+var workers = null;
+
+function getWorkers() {
+	if (!workers) {
+		workers = [];
+		for (let i = 0; i < nWorkers; i++)
+			workers.push(new Worker());
+	}
+	return workers;
+}
+
+function request(op, args) {
+	const alive = getWorkers().filter(w => w.alive());
+	if (alive.length == 0)
+		return Promise.reject(new Error('Classifier not running'));
+	const idle = alive.reduce((w1, w2) => w2.load() < w1.load() ? w2 : w1);
+	return idle.request(op, args);
+}
+
+function reload() {
+	return Promise.all(getWorkers().filter(w => w.alive()).map(w => w.request('reload', {})));
+}
+
+module.exports = {
+	request,
+	reload,
+};
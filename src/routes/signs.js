@@ -1,10 +1,9 @@
 const express = require('express');
-const fs = require('fs-extra');
-const uuid = require('uuid');
 const multer = require('multer');
 const { spawn } = require('child_process');
 
 const util = require('./util');
+const classifier = require('./classifier');
 const unipoints = require('./unipoints');
 
 const Text = require('../models/text');
@@ -180,6 +179,9 @@ router.get('/analysis', async (req, res) => {
 	const genre = req.query && req.query.genre ? req.query.genre.trim() : '';
 	const method = req.query && req.query.method ? req.query.method : 'PCA';
 	const dimension = req.query && req.query.dimension ? req.query.dimension : '2';
+	const source = req.query && req.query.source ? req.query.source : 'images';
+	const mode = req.query && req.query.mode ? req.query.mode : 'fit';
+	const progress = req.query && req.query.progress ? req.query.progress : '';
 	const signnames = signname.length > 0 ? signname.split(/\s+/) : [];
 	const glyphnames = signnames.map(n => unihiero.textToName(n));
 	const textPred = function (text) {
@@ -191,6 +193,7 @@ router.get('/analysis', async (req, res) => {
 	const tokens = glyphnames.length ? await findTokens(textPred, glyphPred) : [];
 	var embeddings = [];
 	var message = '';
+	var note = '';
 	const username = req.session.username;
 	const role = req.session.role;
 	const online = util.online;
@@ -198,35 +201,65 @@ router.get('/analysis', async (req, res) => {
 	if (tokens.length == 0) {
 		res.render('analysis', { message,
 			signname, textname, creator, provenance, period, genre,
-			method, dimension, embeddings, username, role, online });
+			method, dimension, source, mode, embeddings, note, username, role, online });
 		return;
 	}
 
-	const tokensStr = JSON.stringify(tokens);
-	const tokensFile = './python/tmp/' + uuid.v4() + '.json'
-	fs.writeFileSync(tokensFile, tokensStr);
-	const process = spawn(util.python, ['./python/reduction.py', method, dimension, tokensFile]);
+	const process = spawn(util.python, ['./python/reduction.py']);
 
+	/* Frames of reduction.py: uint32 length, JSON header, header.bytes of data */
+	var buffer = Buffer.alloc(0);
 	process.stdout.on('data', (data) => {
-		const reductFile = data.toString();
-		embeddings = fs.readJsonSync(reductFile);
-		fs.removeSync(reductFile);
+		buffer = Buffer.concat([buffer, data]);
+		while (buffer.length >= 4) {
+			const headerLength = buffer.readUInt32LE(0);
+			if (buffer.length < 4 + headerLength)
+				break;
+			const header = JSON.parse(buffer.toString('utf8', 4, 4 + headerLength));
+			const end = 4 + headerLength + header.bytes;
+			if (buffer.length < end)
+				break;
+			if ('progress' in header) {
+				if (progress)
+					req.app.get('io').to(progress).emit('progress', header.progress);
+			} else if ('error' in header) {
+				message = header.error;
+				if (message == 'Too few tokens')
+					message = 'Only ' + tokens.length + ' token(s) found';
+			} else if ('note' in header) {
+				note = header.note;
+			} else if ('result' in header) {
+				var offset = 4 + headerLength;
+				embeddings = header.result.map(i => {
+					const embedding = [];
+					for (let d = 0; d < header.dimension; d++, offset += 4)
+						embedding.push(buffer.readFloatLE(offset));
+					return { ...tokens[i], embedding };
+				});
+			}
+			buffer = buffer.subarray(end);
+		}
 	});
 
 	process.stderr.on('data', (data) => {
-		message = data.toString();
-		if (message == 'Too few tokens')
-			message = 'Only ' + tokens.length + ' token(s) found';
+		console.error(data.toString());
+	});
+
+	process.stdin.on('error', (err) => {
+		console.error('Analysis input: ' + err.message);
 	});
 
 	process.on('close', (code) => {
-		fs.removeSync(tokensFile);
+		if (code != 0 && !message && embeddings.length == 0)
+			message = 'Analysis failed';
 		res.render('analysis', { message,
 			signname, textname, creator, provenance, period, genre,
-			method, dimension, embeddings, username, role, online });
+			method, dimension, source, mode, embeddings, note, username, role, online });
 	});
 
-	process.stdin.end();
+	process.stdin.end(JSON.stringify({ method, dimension, source,
+		signs: mode == 'project' ? glyphnames : null,
+		paths: tokens.map(token => token.path) }));
 });
 
 router.get('/guess', async (req, res) => {
@@ -239,27 +272,30 @@ router.get('/guess', async (req, res) => {
 	const line = req.query.line;
 	const glyph = req.query.glyph;
 
-	const process = spawn(util.python, ['./python/classification.py', text, page, line, glyph]);
-
-	var name = '';
-	var error = '';
-
-	process.stdout.on('data', (data) => {
-		name = data;
-	});
-
-	process.stderr.on('data', (data) => {
-		error = data;
-	});
-
-	process.on('close', (code) => {
-		if (error)
-			res.status(404).send(error);
-		else
-			res.status(200).send(name);
-	});
+	try {
+		const name = await classifier.request('classify', { text, page, line, glyph });
+		res.status(200).send(name);
+	} catch (err) {
+		res.status(404).send(err.message);
+	}
+});
 
-	process.stdin.end();
+router.get('/suggest', async (req, res) => {
+	if (!req.query || !req.query.text || !req.query.page) {
+		util.reportError(res, 'Ill-formed request');
+		return;
+	}
+	const text = req.query.text;
+	const page = req.query.page;
+	const line = req.query.line ? req.query.line : null;
+	const unnamed = req.query.unnamed ? true : false;
+
+	try {
+		const results = await classifier.request('batch', { text, page, line, unnamed });
+		res.status(200).json(results);
+	} catch (err) {
+		res.status(404).send(err.message);
+	}
 });
 
 router.get('/guesser', async (req, res) => {
@@ -274,27 +310,12 @@ router.post('/classify', formUpload.none(), async (req, res) => {
 		return;
 	}
 	const sign = req.body.sign;
-	var results = [];
-	var message = '';
-
-	const process = spawn(util.python, ['./python/guess.py', sign]);
-
-	process.stdout.on('data', (data) => {
-		results = JSON.parse(data.toString());
-	});
-
-	process.stderr.on('data', (data) => {
-		message = data.toString();
-	});
-
-	process.on('close', (code) => {
-		if (message != '')
-			res.status(404).json({ message });
-		else
-			res.status(200).json(results);
-	});
-
-	process.stdin.end();
+	try {
+		const results = await classifier.request('guess', { sign });
+		res.status(200).json(results);
+	} catch (err) {
+		res.status(404).json({ message: err.message });
+	}
 });
 
 module.exports = router;